@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# fake_connection is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# fake_connection is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with fake_connection.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+An in-memory stand-in for a JsonConnection to a hydra server, implementing
+the calls made by the hobbes importer.
+"""
+
+import json
+
+import itertools
+
+import time
+
+from collections import Counter
+
+from threading import Lock
+
+from lxml import etree
+
+class JSONObject(dict):
+    """
+        A dict whose keys can also be read as attributes, like the objects
+        returned by JsonConnection.
+    """
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+def to_object(value):
+    if isinstance(value, dict):
+        return JSONObject((k, to_object(v)) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        return [to_object(v) for v in value]
+    return value
+
+class FakeConnection(object):
+    """
+        Records every call, and the size of its request, so the benchmarks
+        can report how much work was sent to hydra. latency adds a delay
+        (in seconds) to every call.
+    """
+    def __init__(self, latency=0.0):
+        self.url = 'http://fake-hydra/json'
+        self.session_id = 'fake'
+        self.latency = latency
+
+        self.lock = Lock()
+        self.ids = itertools.count(1)
+        self.num_calls = Counter()
+        self.bytes_sent = 0
+
+        self.attr_ids  = {}
+        self.templates = {}
+        self.networks  = {}
+        self.scenarios = {}
+        self.resource_attrs = {}
+        self.num_values = 0
+
+    def next_id(self):
+        with self.lock:
+            return next(self.ids)
+
+    def call(self, func, args):
+        request = json.dumps(args, default=list)
+        with self.lock:
+            self.num_calls[func] += 1
+            self.bytes_sent += len(request)
+
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        return to_object(getattr(self, func)(**json.loads(request)))
+
+    def get_project(self, project_id):
+        return {'id':project_id, 'name':'Project %s'%project_id}
+
+    def add_project(self, project):
+        project['id'] = self.next_id()
+        return project
+
+    def upload_template_xml(self, template_xml):
+        tree = etree.fromstring(template_xml)
+
+        types = []
+        for resource in tree.find('resources'):
+            typeattrs = []
+            for attr in resource.findall('attribute'):
+                name = attr.find('name').text
+                if name not in self.attr_ids:
+                    self.attr_ids[name] = self.next_id()
+                typeattrs.append({'attr_id':self.attr_ids[name], 'name':name})
+            types.append({'id'        : self.next_id(),
+                          'name'      : resource.find('name').text,
+                          'resource_type': resource.find('type').text,
+                          'typeattrs' : typeattrs})
+
+        template = {'id'   : self.next_id(),
+                    'name' : tree.find('template_name').text,
+                    'types': types}
+        self.templates[template['id']] = template
+        return template
+
+    def get_template(self, template_id):
+        return self.templates[template_id]
+
+    def get_template_attributes(self, template_id):
+        attrs = {}
+        for t in self.templates[template_id]['types']:
+            for ta in t['typeattrs']:
+                attrs[ta['attr_id']] = {'id':ta['attr_id'], 'name':ta['name']}
+        return attrs.values()
+
+    def _add_resource_attrs(self, network_id, ref_key, resource):
+        for a in resource.get('attributes', []):
+            a['id'] = self.next_id()
+            a['ref_key'] = ref_key
+            a['ref_id'] = resource['id']
+            self.resource_attrs[network_id].append(a)
+
+    def add_network(self, net):
+        net['id'] = self.next_id()
+        self.resource_attrs[net['id']] = []
+
+        node_ids = {}
+        for node in net['nodes']:
+            node_ids[node['id']] = self.next_id()
+            node['id'] = node_ids[node['id']]
+            self._add_resource_attrs(net['id'], 'NODE', node)
+
+        for link in net['links']:
+            link['id'] = self.next_id()
+            link['node_1_id'] = node_ids.get(link.get('node_1_id'))
+            link['node_2_id'] = node_ids.get(link.get('node_2_id'))
+            self._add_resource_attrs(net['id'], 'LINK', link)
+
+        self._add_resource_attrs(net['id'], 'NETWORK', net)
+
+        for group in net.get('resourcegroups', []):
+            group['id'] = self.next_id()
+
+        self.networks[net['id']] = net
+        return net
+
+    def get_network(self, network_id, include_data='N'):
+        return self.networks[network_id]
+
+    def get_all_node_attributes(self, network_id, template_id=None):
+        return [a for a in self.resource_attrs[network_id] if a['ref_key'] == 'NODE']
+
+    def get_all_link_attributes(self, network_id, template_id=None):
+        return [a for a in self.resource_attrs[network_id] if a['ref_key'] == 'LINK']
+
+    def add_scenario(self, network_id, scen):
+        scen['id'] = self.next_id()
+        scen['network_id'] = network_id
+        self.scenarios[scen['id']] = scen
+        self.networks[network_id].setdefault('scenarios', []).append(scen)
+        return scen
+
+    def get_scenario(self, scenario_id):
+        return self.scenarios[scenario_id]
+
+    def update_resourcedata(self, scenario_id, resource_scenarios):
+        with self.lock:
+            self.num_values += len(resource_scenarios)
+        return resource_scenarios
+
+    def bulk_insert_data(self, bulk_data):
+        return [{'id':self.next_id()} for d in bulk_data]
+
+    def _network_of(self, ref_key, resource_id):
+        for network in self.networks.values():
+            if any(r['id'] == resource_id for r in network[ref_key]):
+                return network
+
+    def _replace(self, ref_key, resource):
+        network = self._network_of(ref_key, resource['id'])
+        resources = network[ref_key]
+        for i, r in enumerate(resources):
+            if r['id'] == resource['id']:
+                resources[i] = resource
+        return resource
+
+    def _remove(self, ref_key, resource_id):
+        network = self._network_of(ref_key, resource_id)
+        network[ref_key] = [r for r in network[ref_key] if r['id'] != resource_id]
+
+    def add_nodes(self, network_id, nodes):
+        for node in nodes:
+            node['id'] = self.next_id()
+            self._add_resource_attrs(network_id, 'NODE', node)
+        self.networks[network_id]['nodes'].extend(nodes)
+        return nodes
+
+    def update_node(self, node):
+        return self._replace('nodes', node)
+
+    def delete_node(self, node_id, purge_data='N'):
+        self._remove('nodes', node_id)
+
+    def add_links(self, network_id, links):
+        for link in links:
+            link['id'] = self.next_id()
+            self._add_resource_attrs(network_id, 'LINK', link)
+        self.networks[network_id]['links'].extend(links)
+        return links
+
+    def update_link(self, link):
+        return self._replace('links', link)
+
+    def delete_link(self, link_id, purge_data='N'):
+        self._remove('links', link_id)
+
+    def delete_resource_scenario(self, scenario_id, resource_attr_id):
+        with self.lock:
+            self.num_values -= 1
@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# run_benchmarks is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# run_benchmarks is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with run_benchmarks.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+Offline benchmarks of the hobbes importer and template builder.
+
+A synthetic hobbes network is served by a local stub server, and hydra is
+replaced by an in-memory fake connection, so neither cwn.casil.ucdavis.edu
+nor a hydra server is needed. Each scenario is timed, and the results are
+appended to a JSON lines file so they can be compared between runs.
+
+The timeseries conversion is also timed on the extras of the whole network
+in each parse mode: a single thread, several threads, and several processes.
+
+Basic usage::
+
+       run_benchmarks.py [-h] [--nodes NODES] [--series-length LENGTH]
+
+"""
+
+import argparse as ap
+import logging
+
+import json
+
+import os, sys
+
+import time
+
+import subprocess
+
+from collections import OrderedDict
+
+from datetime import datetime
+
+__location__ = os.path.split(os.path.abspath(__file__))[0]
+
+sys.path.insert(0, os.path.join(__location__, '..', 'plugins', 'hobbes_import'))
+
+from hobbes_import import HobbesImporter
+from hobbes_sync import has_extras
+from create_hobbes_template import HobbesTemplateBuilder
+
+from synthetic_network import SyntheticHobbesNetwork
+from stub_server import StubHobbesServer
+from fake_connection import FakeConnection
+
+log = logging.getLogger(__name__)
+
+DEFAULT_RESULTS = os.path.join(__location__, 'benchmark_results.jsonl')
+
+def cpu_time():
+    t = os.times()
+    return t[0] + t[1]
+
+class Benchmark(object):
+    """
+        Times the stages of an import of a synthetic network.
+    """
+    def __init__(self, network, repeat=3, hobbes_latency=0.0, hydra_latency=0.0,
+                 hobbes_error_rate=0.0, workers=4, importer_args=None):
+        self.network = network
+        self.repeat  = repeat
+        self.workers = workers
+        self.hydra_latency = hydra_latency
+        self.importer_args = importer_args or {}
+
+        self.server = StubHobbesServer(network, latency=hobbes_latency,
+                                       error_rate=hobbes_error_rate)
+
+        self.results = OrderedDict()
+
+    def make_importer(self):
+        importer = HobbesImporter(session_id='benchmark',
+                                  hobbes_url=self.server.url,
+                                  **self.importer_args)
+        importer.connection = FakeConnection(latency=self.hydra_latency)
+        return importer
+
+    def time(self, name, setup, func):
+        """
+            Run func repeat times, calling setup (untimed) before each run,
+            and keep the fastest time.
+        """
+        best = None
+        for i in range(self.repeat):
+            state = setup()
+
+            requests_before = self.server.num_requests
+            bytes_before    = self.server.bytes_sent
+
+            wall_start = time.time()
+            cpu_start  = cpu_time()
+            func(state)
+            wall = time.time() - wall_start
+            cpu  = cpu_time() - cpu_start
+
+            result = dict(
+                wall          = wall,
+                cpu           = cpu,
+                http_requests = self.server.num_requests - requests_before,
+                http_bytes    = self.server.bytes_sent - bytes_before,
+            )
+            if hasattr(state, 'connection'):
+                result['hydra_calls'] = sum(state.connection.num_calls.values())
+                result['hydra_bytes'] = state.connection.bytes_sent
+
+            if best is None or result['wall'] < best['wall']:
+                best = result
+
+        self.results[name] = best
+        log.info("%s: %.3fs wall, %.3fs cpu", name, best['wall'], best['cpu'])
+        return best
+
+    def setup_network(self):
+        importer = self.make_importer()
+        importer.fetch_remote_network()
+        return importer
+
+    def setup_template(self):
+        importer = self.setup_network()
+
+        tmpl = HobbesTemplateBuilder(client=importer.client)
+        importer.upload_template(tmpl.convert(importer.json_net))
+        return importer
+
+    def setup_topology(self):
+        importer = self.setup_template()
+        importer.import_network_topology()
+        importer.connection.num_calls.clear()
+        importer.connection.bytes_sent = 0
+        return importer
+
+    def setup_extras(self):
+        """
+            An imported network, with the extras of every node already
+            requested once, so the stub server has generated them.
+        """
+        importer = self.setup_topology()
+        importer.build_resource_attr_index()
+
+        node_ids = dict((n.name, n.id) for n in importer.network.nodes)
+        prmnames = [f['properties']['prmname'] for f in importer.json_net
+                    if has_extras(f['properties'])]
+        for prmname in prmnames:
+            importer.fetch_node_extras(prmname)
+
+        return importer, node_ids, prmnames
+
+    def convert_extras(self, parse_mode, workers):
+        """
+            Fetch, convert and build the extras of every node in the network.
+        """
+        def run(state):
+            importer, node_ids, prmnames = state
+            importer.parse_mode = parse_mode
+            importer.convert_workers = workers
+            with importer.conversion_processes():
+                for resource_scenarios in importer.extras_pipeline(prmnames, node_ids):
+                    pass
+        return run
+
+    def convert(self, importer):
+        tmpl = HobbesTemplateBuilder(client=importer.client)
+        tmpl.convert(importer.json_net)
+
+    def run(self):
+        self.server.start()
+        try:
+            self.time('fetch_remote_network',
+                      self.make_importer,
+                      lambda importer: importer.fetch_remote_network())
+
+            self.time('convert', self.setup_network, self.convert)
+
+            self.time('import_network_topology',
+                      self.setup_template,
+                      lambda importer: importer.import_network_topology())
+
+            self.time('import_data',
+                      self.setup_topology,
+                      lambda importer: importer.import_data(include_timeseries=True))
+
+            self.time('extras (single thread)', self.setup_extras,
+                      self.convert_extras('thread', 1))
+            self.time('extras (%s threads)'%self.workers, self.setup_extras,
+                      self.convert_extras('thread', self.workers))
+            self.time('extras (%s processes)'%self.workers, self.setup_extras,
+                      self.convert_extras('process', self.workers))
+        finally:
+            self.server.stop()
+
+        return self.results
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=__location__).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_previous(results_file, params):
+    """
+        Find the most recent recorded run with the same parameters.
+    """
+    if not os.path.exists(results_file):
+        return None
+
+    previous = None
+    with open(results_file) as f:
+        for line in f:
+            record = json.loads(line)
+            if record['params'] == params:
+                previous = record
+    return previous
+
+def commandline_parser():
+    parser = ap.ArgumentParser(
+        description="""Benchmark the hobbes importer against a synthetic network,
+without a hobbes or hydra server.
+        """, formatter_class=ap.RawDescriptionHelpFormatter)
+    parser.add_argument('--nodes', type=int, default=500,
+                        help='''The number of nodes in the network.''')
+    parser.add_argument('--fan-out', type=int, default=2,
+                        help='''The maximum number of links out of each node.''')
+    parser.add_argument('--scalars', type=int, default=5,
+                        help='''The number of scalar attributes of each node type.''')
+    parser.add_argument('--extras-fraction', type=float, default=0.5,
+                        help='''The fraction of nodes with extras.''')
+    parser.add_argument('--extras', type=int, default=2,
+                        help='''The number of timeseries in each node's extras.''')
+    parser.add_argument('--series-length', type=int, default=3650,
+                        help='''The number of values in each timeseries.''')
+    parser.add_argument('--hobbes-latency', type=float, default=0.0,
+                        help='''Seconds added to each response of the stub hobbes server.''')
+    parser.add_argument('--hobbes-error-rate', type=float, default=0.0,
+                        help='''The fraction of requests the stub hobbes server
+                        answers with 503.''')
+    parser.add_argument('--hydra-latency', type=float, default=0.0,
+                        help='''Seconds added to each call to the fake hydra server.''')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='''The number of threads, or processes, converting
+                        timeseries when comparing the parse modes.''')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='''The number of times each scenario is run. The fastest is kept.''')
+    parser.add_argument('--results', default=DEFAULT_RESULTS,
+                        help='''The file the results are appended to.''')
+    return parser
+
+def run():
+    parser = commandline_parser()
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    network = SyntheticHobbesNetwork(num_nodes       = args.nodes,
+                                     fan_out         = args.fan_out,
+                                     num_scalars     = args.scalars,
+                                     extras_fraction = args.extras_fraction,
+                                     num_extras      = args.extras,
+                                     series_length   = args.series_length)
+
+    params = network.params()
+    params['hobbes_latency'] = args.hobbes_latency
+    params['hydra_latency']  = args.hydra_latency
+    params['workers']        = args.workers
+    if args.hobbes_error_rate > 0:
+        params['hobbes_error_rate'] = args.hobbes_error_rate
+
+    benchmark = Benchmark(network,
+                          repeat         = args.repeat,
+                          hobbes_latency = args.hobbes_latency,
+                          hydra_latency  = args.hydra_latency,
+                          hobbes_error_rate = args.hobbes_error_rate,
+                          workers        = args.workers)
+    results = benchmark.run()
+
+    previous = load_previous(args.results, params)
+
+    print "%-25s %10s %10s %10s"%('scenario', 'wall (s)', 'cpu (s)', 'change')
+    for name, result in results.items():
+        change = ''
+        if previous is not None and name in previous['results']:
+            before = previous['results'][name]['wall']
+            if before > 0:
+                change = '%+.1f%%'%(100.0*(result['wall'] - before)/before)
+        print "%-25s %10.3f %10.3f %10s"%(name, result['wall'], result['cpu'], change)
+
+    record = dict(
+        timestamp = datetime.now().isoformat(),
+        commit    = git_commit(),
+        params    = params,
+        results   = results,
+    )
+    with open(args.results, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# stub_server is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# stub_server is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with stub_server.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+A local stand-in for the hobbes server, serving a synthetic network.
+"""
+
+import logging
+
+import json
+
+import hashlib
+
+import random
+
+import time
+
+import urlparse
+
+from threading import Thread, Lock
+
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+log = logging.getLogger(__name__)
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class StubHobbesServer(object):
+    """
+        Serves network/get and network/extras for a SyntheticHobbesNetwork
+        on a free local port. Responses carry an ETag, and conditional
+        requests are answered with 304, as by a caching web server.
+
+        latency adds a delay (in seconds) to every response, to stand in
+        for the round trip to the real server. error_rate is the fraction of
+        requests answered with 503, as by an overloaded server.
+    """
+    def __init__(self, network, latency=0.0, error_rate=0.0):
+        self.network = network
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(network.seed)
+
+        self.network_body = json.dumps(network.features)
+        #Extras are generated on the first request for them, then kept, so
+        #later requests cost no more than serving a file.
+        self.extras_bodies = {}
+
+        self.lock = Lock()
+        self.num_requests = 0
+        self.bytes_sent = 0
+
+        self.server = None
+        self.thread = None
+        self.url = None
+
+    def respond(self, path, query, headers):
+        """
+            Return the status and body of a response.
+        """
+        if self.error_rate > 0:
+            with self.lock:
+                if self.random.random() < self.error_rate:
+                    return 503, ''
+
+        if path == '/network/get':
+            body = self.network_body
+        elif path == '/network/extras':
+            prmname = query.get('prmname', [None])[0]
+            if prmname not in self.network.extras_names:
+                return 404, ''
+            body = self.extras_bodies.get(prmname)
+            if body is None:
+                body = self.extras_bodies[prmname] = json.dumps(self.network.extras(prmname))
+        else:
+            return 404, ''
+
+        etag = '"%s"'%hashlib.sha1(body).hexdigest()
+        if headers.get('If-None-Match') == etag:
+            return 304, '', etag
+
+        return 200, body, etag
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if stub.latency > 0:
+                    time.sleep(stub.latency)
+
+                url = urlparse.urlparse(self.path)
+                result = stub.respond(url.path, urlparse.parse_qs(url.query), self.headers)
+
+                status, body = result[0], result[1]
+                self.send_response(status)
+                if len(result) > 2:
+                    self.send_header('ETag', result[2])
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+                with stub.lock:
+                    stub.num_requests += 1
+                    stub.bytes_sent += len(body)
+
+            def log_message(self, format, *args):
+                log.debug(format, *args)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%s'%self.server.server_address[1]
+
+        self.thread = Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        return self.url
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
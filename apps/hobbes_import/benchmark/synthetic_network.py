@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# synthetic_network is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# synthetic_network is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with synthetic_network.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+Generates synthetic hobbes networks, in the same GeoJSON form as the
+network/get and network/extras endpoints of the hobbes server.
+"""
+
+import random
+
+from datetime import date, timedelta
+
+NODE_TYPES = ['Junction', 'Surface Storage', 'Agricultural Demand',
+              'Power Plant', 'Water Treatment']
+
+REGIONS = ['Sacramento', 'San Joaquin', 'Tulare', 'Bay Delta']
+
+class SyntheticHobbesNetwork(object):
+    """
+        A randomly generated, but reproducible, hobbes network.
+
+        num_nodes      : The number of nodes.
+        fan_out        : The maximum number of links out of each node.
+        num_scalars    : The number of scalar properties of each node type.
+        extras_fraction: The fraction of nodes with extras (timeseries).
+        num_extras     : The number of timeseries in each node's extras.
+        series_length  : The number of daily values in each timeseries.
+    """
+    def __init__(self, num_nodes=500, fan_out=2, num_scalars=5,
+                 extras_fraction=0.5, num_extras=2, series_length=3650, seed=1):
+
+        self.num_nodes       = num_nodes
+        self.fan_out         = fan_out
+        self.num_scalars     = num_scalars
+        self.extras_fraction = extras_fraction
+        self.num_extras      = num_extras
+        self.series_length   = series_length
+        self.seed            = seed
+
+        self.features = self.generate_features()
+        self.extras_names = dict((f['properties']['prmname'], f['properties'].get('extras', {}).keys())
+                                 for f in self.features)
+
+    def params(self):
+        return dict(
+            num_nodes       = self.num_nodes,
+            fan_out         = self.fan_out,
+            num_scalars     = self.num_scalars,
+            extras_fraction = self.extras_fraction,
+            num_extras      = self.num_extras,
+            series_length   = self.series_length,
+            seed            = self.seed,
+        )
+
+    def generate_features(self):
+        rand = random.Random(self.seed)
+
+        names = ['SN_%05d'%i for i in range(self.num_nodes)]
+
+        features = []
+        for i, name in enumerate(names):
+            node_type = NODE_TYPES[i % len(NODE_TYPES)]
+            props = dict(
+                prmname     = name,
+                type        = node_type,
+                description = "Synthetic %s %s"%(node_type, i),
+                regions     = [REGIONS[i % len(REGIONS)]],
+                origins     = [],
+                terminals   = [],
+                repo        = {'tag':'v%s'%(i % 3), 'branch':'master',
+                               'path':'/network/%s'%name},
+            )
+
+            #Values are rounded so that many nodes share them, as in hobbes.
+            for s in range(self.num_scalars):
+                props['%s_param_%s'%(node_type.replace(' ', '_').lower(), s)] = \
+                    round(rand.uniform(0, 10), 1)
+
+            if rand.random() < self.extras_fraction:
+                props['extras'] = dict(('%s_series_%s'%(node_type.replace(' ', '_').lower(), e),
+                                        {'units':'KAF'})
+                                       for e in range(self.num_extras))
+
+            #Some hobbes nodes have two coordinates.
+            coords = [rand.uniform(-122, -118), rand.uniform(34, 40)]
+            if i % 7 == 0:
+                coords = [coords, [coords[0] + 0.01, coords[1] + 0.01]]
+
+            features.append({
+                'type'      : 'Feature',
+                'geometry'  : {'type':'Point', 'coordinates':coords},
+                'properties': props,
+            })
+
+        #Links only go downstream, to nodes with a higher index.
+        for i in range(self.num_nodes - 1):
+            num_links = rand.randint(1, self.fan_out)
+            for j in rand.sample(range(i + 1, min(i + 1 + 4*self.fan_out, self.num_nodes)),
+                                 min(num_links, self.num_nodes - i - 1)):
+                linkname = '%s-%s'%(names[i], names[j])
+                features[i]['properties']['terminals'].append({'link_prmname':linkname})
+                features[j]['properties']['origins'].append({'link_prmname':linkname})
+
+        return features
+
+    def extras(self, prmname):
+        """
+            The extras of a node, as returned by network/extras. These are
+            generated on request, so they need not all be held in memory.
+        """
+        rand = random.Random("%s%s"%(self.seed, prmname))
+
+        extras = {'prmname':prmname, 'readme':'Synthetic timeseries for %s'%prmname}
+
+        start = date(1921, 10, 1)
+        for name in self.extras_names.get(prmname, []):
+            series = [['date', name]]
+            for d in range(self.series_length):
+                series.append([str(start + timedelta(days=d)), round(rand.uniform(0, 1000), 3)])
+            extras[name] = series
+
+        return extras
@@ -22,79 +22,177 @@ from lxml import etree
 
 import json
 
-import requests
+import hashlib
 
 import os, sys
 
-from HydraLib.PluginLib import xsd_validate
+from HydraLib.HydraException import HydraPluginError
+from HydraLib import config
+
+from hobbes_client import HobbesClient, HobbesCache
 
 
 log = logging.getLogger(__name__)
 
 __location__ = os.path.split(sys.argv[0])[0]
 
+DEFAULT_TEMPLATE_CACHE = os.path.expanduser(os.path.join('~', '.hobbes_templates.json'))
+
+TEMPLATE_NAME = 'HobbesTemplate'
+
+#Node properties which are not attributes. The repo is an attribute, but
+#is not a scalar, so is sent as a dataset of its own.
+NON_ATTRIBUTES = frozenset(['origins', 'prmname', 'regions', 'terminals', 'description', 'extras', 'type'])
+
+def schema_fingerprint(template_struct):
+    """
+        A hash of the types, and the attributes of each type, of a template
+        struct. Two networks with the same fingerprint can share a template.
+    """
+    schema = sorted((type_name, sorted(attributes))
+                    for type_name, attributes in template_struct.items())
+    return hashlib.sha1(json.dumps(schema)).hexdigest()
+
+def template_fingerprint(template, attributes):
+    """
+        The schema fingerprint of a template fetched from hydra, given its
+        attributes, for comparison with the fingerprint of a template struct.
+        Only the node types are part of the schema.
+    """
+    attr_names = dict((a.id, a.name) for a in attributes)
+    template_struct = {}
+    for t in template.types:
+        if t.resource_type == 'NODE':
+            template_struct[t.name] = [attr_names.get(tattr.attr_id) for tattr in t.typeattrs]
+    return schema_fingerprint(template_struct)
+
+#The template schema, loaded on first use
+_template_schema = None
+
+def validate_template(tree):
+    """
+        Validate a template tree against the hydra template XSD, without
+        writing it to disk and parsing it again.
+    """
+    global _template_schema
+    if _template_schema is None:
+        xsd_path = os.path.expanduser(config.get('templates', 'template_xsd_path'))
+        _template_schema = etree.XMLSchema(etree.parse(xsd_path))
+
+    try:
+        _template_schema.assertValid(tree)
+    except etree.DocumentInvalid as e:
+        raise HydraPluginError('Template validation failed: ' + e.message)
+
+class TemplateCache(object):
+    """
+        Remembers the hydra template built for each schema fingerprint, on
+        each hydra server, so an unchanged schema need not be uploaded again.
+    """
+    def __init__(self, path=DEFAULT_TEMPLATE_CACHE):
+        self.path = path
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except ValueError:
+            log.warn("Ignoring corrupt template cache %s", self.path)
+            return {}
+
+    def _key(self, server_url, fingerprint):
+        return "%s %s"%(server_url, fingerprint)
+
+    def get(self, server_url, fingerprint):
+        """
+            The ID of the template with this fingerprint on the server, or
+            None if there isn't one.
+        """
+        return self._load().get(self._key(server_url, fingerprint))
+
+    def _save(self, templates):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(templates, f, indent=2)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(tmp_path, self.path)
+
+    def put(self, server_url, fingerprint, template_id):
+        templates = self._load()
+        templates[self._key(server_url, fingerprint)] = template_id
+        self._save(templates)
+
+    def remove(self, server_url, fingerprint):
+        templates = self._load()
+        if templates.pop(self._key(server_url, fingerprint), None) is not None:
+            self._save(templates)
+
 class HobbesTemplateBuilder(object):
-    #Keeps track of all the timeseries we identify in hobbes nodes so we
-    #can set the correct data type in the template.
-    timeseries = []
     output = os.path.join(__location__, '../', '../', 'template', 'HobbesTemplate', 'template', 'template.xml')
 
+    def __init__(self, client=None):
+        if client is None:
+            client = HobbesClient(cache=HobbesCache())
+        self.client = client
+        #Keeps track of all the timeseries we identify in hobbes nodes so we
+        #can set the correct data type in the template.
+        self.timeseries = set()
+
     def build_template_struct(self, json_net=None):
         """
             Read the file containing the network data and build a template from it.
+            The attributes of a type are those of all its nodes, including
+            their extras, gathered in one pass over the nodes.
         """
 
-        template_struct = {}
-        
         if json_net is None:
-            net_response = requests.get("http://cwn.casil.ucdavis.edu/network/get") #JSON Network
-            if net_response.status_code != 200:
-                raise Exception("A connection error has occurred with status code: %s"%net_response.status_code)
-
-            json_net = json.loads(net_response.content)
+            json_net = self.client.get_network()
 
-        non_attributes = set(['origins', 'prmname', 'regions', 'terminals', 'description', 'extras', 'type'])
+        type_attributes = {}
 
-        all_extras = [] # For the moment, an extra is seen as a timeseries, so we want to keep track of them separately
+        # For the moment, an extra is seen as a timeseries, so we want to keep track of them separately
+        all_extras = set()
 
         for node in json_net:
 
             props = node['properties']
 
-            node_type = props['type']
+            attributes = type_attributes.get(props['type'])
+            if attributes is None:
+                attributes = type_attributes[props['type']] = set()
 
-            extras = []
-            if template_struct.get(node_type):
-                type_attributes = template_struct[node_type]
-            else:
-                extras = props.get('extras', {}).keys()
-
-                all_extras.extend(extras)
-                
-                if len(extras) > 0:
-                    type_attributes = extras
-                else:
-                    type_attributes = []
+            extras = props.get('extras')
+            if extras:
+                all_extras.update(extras)
+                attributes.update(extras)
 
             #Identify the attributes that can be handled automatically
-            attributes = set(props.keys()+extras) - non_attributes
-
-            new_attributes = attributes - set(type_attributes)
+            attributes.update(props)
 
-            if len(new_attributes) > 0:
-                log.info("Extending %s attributes with %s"%(node_type, new_attributes))
-                type_attributes.extend(list(new_attributes))
-                template_struct[node_type] = type_attributes
+        template_struct = {}
+        for node_type, attributes in type_attributes.items():
+            attributes = attributes - NON_ATTRIBUTES
+            if len(attributes) > 0:
+                log.info("%s attributes: %s"%(node_type, sorted(attributes)))
+                template_struct[node_type] = sorted(attributes)
 
         self.timeseries = all_extras
 
         return template_struct
 
-    def convert(self, json_net=None):
+    def convert(self, json_net=None, template_struct=None, output=None):
+        """
+            Build and validate the template XML, returning it as a string.
+            It is also written to the output file, if one is given.
+        """
 
-        template_struct = self.build_template_struct(json_net)
+        if template_struct is None:
+            template_struct = self.build_template_struct(json_net)
 
-        template_name = 'HobbesTemplate'
+        template_name = TEMPLATE_NAME
 
         tree = etree.Element('template_definition')
         tname = etree.SubElement(tree, 'template_name')
@@ -207,14 +305,19 @@ class HobbesTemplateBuilder(object):
                 data_type = etree.SubElement(att, 'data_type')
                 data_type.text = 'descriptor'
 
-        with open(self.output, "w") as fout:
-            fout.write(etree.tostring(tree, pretty_print=True))
+        validate_template(tree)
+
+        template_xml = etree.tostring(tree, pretty_print=True)
+
+        if output is not None:
+            with open(output, "w") as fout:
+                fout.write(template_xml)
 
-        xsd_validate(self.output)
+        return template_xml
 
 def run():
     template_builder = HobbesTemplateBuilder()
-    template_builder.convert()
+    template_builder.convert(output=template_builder.output)
     
 
 if __name__ == '__main__':
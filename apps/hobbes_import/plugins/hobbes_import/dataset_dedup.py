@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# dataset_dedup is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# dataset_dedup is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with dataset_dedup.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+Content-addressed deduplication of datasets before they are uploaded.
+"""
+
+import logging
+
+import json
+
+import hashlib
+
+from collections import OrderedDict
+
+from threading import Lock
+
+log = logging.getLogger(__name__)
+
+def dataset_hash(dataset):
+    """
+        A hash of the content of a dataset: its type, value, unit, dimension
+        and metadata. Its name is not included, as it does not affect the data.
+    """
+    content = [dataset.get('type'),
+               dataset.get('value'),
+               dataset.get('unit'),
+               dataset.get('dimension'),
+               dataset.get('metadata')]
+    return hashlib.sha1(json.dumps(content, sort_keys=True)).hexdigest()
+
+class DatasetDeduplicator(object):
+    """
+        Sends each distinct dataset to hydra only once. The first time a
+        dataset is seen, it is created with 'bulk_insert_data'. Every
+        resource scenario then refers to its dataset by ID instead of
+        carrying a copy of it. Batches are resolved one at a time, so a
+        dataset is not created twice by batches uploading at once.
+    """
+    def __init__(self):
+        self.lock = Lock()
+        #Dataset IDs in hydra, by dataset hash
+        self.dataset_ids = {}
+        self.num_datasets = 0
+
+    def resolve(self, connection, batch):
+        """
+            Replace the dataset of each resource scenario in a batch with a
+            reference to a dataset in hydra, creating any which are new.
+        """
+        hashes = [dataset_hash(rs['value']) for rs in batch]
+
+        with self.lock:
+            self._resolve(connection, batch, hashes)
+
+        return batch
+
+    def _resolve(self, connection, batch, hashes):
+        new_datasets = OrderedDict()
+        for rs, h in zip(batch, hashes):
+            if h not in self.dataset_ids and h not in new_datasets:
+                new_datasets[h] = rs['value']
+
+        if len(new_datasets) > 0:
+            saved = connection.call('bulk_insert_data', {'bulk_data':new_datasets.values()})
+            for h, dataset in zip(new_datasets.keys(), saved):
+                self.dataset_ids[h] = getattr(dataset, 'id', dataset)
+
+        for rs, h in zip(batch, hashes):
+            rs['value'] = {'id': self.dataset_ids[h]}
+
+        self.num_datasets += len(batch)
+
+    @property
+    def num_unique(self):
+        return len(self.dataset_ids)
+
+    @property
+    def ratio(self):
+        """
+            The number of datasets for every distinct dataset sent.
+        """
+        if self.num_unique == 0:
+            return 1.0
+        return float(self.num_datasets) / self.num_unique
+
+    def report(self):
+        return "%s datasets deduplicated to %s (ratio %.2f)" % (self.num_datasets,
+                                                                 self.num_unique,
+                                                                 self.ratio)
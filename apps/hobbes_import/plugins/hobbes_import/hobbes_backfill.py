@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# hobbes_backfill is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# hobbes_backfill is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with hobbes_backfill.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+Background backfill of the timeseries of an imported network.
+
+An import can send the topology, scalars and repo descriptors of the
+network, return, and leave the timeseries to a separate process. That
+process records its progress in a journal, so it can be resumed if it is
+interrupted, and in a JSON status file, which can be read at any time.
+"""
+
+import logging
+
+import json
+
+import os, sys
+
+import subprocess
+
+import time
+
+from HydraLib.PluginLib import write_output
+from HydraLib.HydraException import HydraPluginError
+
+from hobbes_sync import has_extras
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BACKFILL_JOURNAL = os.path.join(os.path.expanduser('~'), '.hobbes_backfill.journal')
+DEFAULT_BACKFILL_STATUS  = os.path.join(os.path.expanduser('~'), '.hobbes_backfill.json')
+
+#The environment variable through which the backfill is given the hydra
+#session of the import, so it does not appear in the process list.
+SESSION_ENV = 'HOBBES_BACKFILL_SESSION'
+
+class BackfillStatus(object):
+    """
+        The progress of a backfill, written to a JSON file. Writes are
+        atomic, so the file can be read while the backfill is running, and
+        at most one is made every 'interval' seconds, except when the state
+        changes.
+    """
+    def __init__(self, path=DEFAULT_BACKFILL_STATUS, interval=1.0):
+        self.path = path
+        self.interval = interval
+        self.last_write = 0.0
+
+        self.status = dict(
+            state           = 'starting',
+            pid             = os.getpid(),
+            network_id      = None,
+            scenario_id     = None,
+            nodes_total     = 0,
+            nodes_done      = 0,
+            values_uploaded = 0,
+            started         = time.time(),
+            updated         = None,
+            error           = None,
+        )
+
+    def update(self, **kwargs):
+        force = 'state' in kwargs
+        self.status.update(kwargs)
+        if force is True or time.time() - self.last_write >= self.interval:
+            self.write()
+
+    def write(self):
+        self.status['updated'] = self.last_write = time.time()
+        tmp_path = "%s.%s.tmp"%(self.path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(self.status, f, indent=2)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(tmp_path, self.path)
+
+def read_status(path=DEFAULT_BACKFILL_STATUS):
+    """
+        Read the status of the last backfill, or None if there has not been one.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def describe_status(status):
+    if status is None:
+        return "No timeseries backfill has been started."
+
+    text = "Timeseries backfill of network %s, scenario %s: %s. %s of %s nodes, %s values uploaded." % \
+        (status['network_id'], status['scenario_id'], status['state'],
+         status['nodes_done'], status['nodes_total'], status['values_uploaded'])
+    if status['error'] is not None:
+        text += " Error: %s"%status['error']
+    return text
+
+def start_backfill(script, args, log_path, session_id=None):
+    """
+        Start the backfill in a separate process, which carries on after the
+        import has returned. Its output goes to log_path. The session_id,
+        if given, is passed in the environment of the process.
+    """
+    command = [sys.executable, script] + args
+
+    env = dict(os.environ)
+    if session_id is not None:
+        env[SESSION_ENV] = str(session_id)
+
+    kwargs = {'env':env}
+    if os.name == 'nt':
+        #DETACHED_PROCESS, so it is not tied to the plugin's console
+        kwargs['creationflags'] = 0x00000008
+    else:
+        kwargs['close_fds'] = True
+
+    with open(log_path, 'a') as output:
+        process = subprocess.Popen(command, stdout=output, stderr=subprocess.STDOUT,
+                                   **kwargs)
+
+    log.info("Started timeseries backfill (pid %s), logging to %s", process.pid, log_path)
+    return process
+
+class HobbesBackfill(object):
+    """
+        Uploads the timeseries of the nodes of a network imported without
+        them. The importer's journal records the extras fetched and the data
+        uploaded, so a backfill of the same network and scenario which was
+        interrupted carries on from where it stopped.
+    """
+    def __init__(self, importer, status):
+        self.importer   = importer
+        self.connection = importer.connection
+        self.journal    = importer.journal
+        self.status     = status
+
+    def open_journal(self, network_id, scenario_id, template_id):
+        """
+            Resume the journal if it is of an unfinished backfill of the same
+            scenario, or else start a new one.
+        """
+        journal = self.journal
+        if os.path.exists(journal.path):
+            try:
+                journal.load()
+            except HydraPluginError as e:
+                log.info("Not resuming: %s", e)
+            else:
+                if (journal.network_id, journal.scenario_id) == (network_id, scenario_id):
+                    write_output("Resuming timeseries backfill. %s values already uploaded."
+                                 % len(journal.uploaded))
+                    return
+            journal.close()
+
+        journal.start(network_id, scenario_id, template_id)
+
+    def run(self, network_id, scenario_id):
+        network_id, scenario_id = int(network_id), int(scenario_id)
+        self.status.update(state='running', network_id=network_id, scenario_id=scenario_id)
+        try:
+            self.backfill(network_id, scenario_id)
+        except Exception as e:
+            self.status.update(state='failed', error=str(e))
+            raise
+        self.status.update(state='complete')
+
+    def backfill(self, network_id, scenario_id):
+        importer = self.importer
+
+        importer.network = self.connection.call('get_network', {'network_id':network_id,
+                                                                'include_data':'N'})
+        importer.fetch_template(importer.network.types[0].template_id)
+        importer.scenario = self.connection.call('get_scenario', {'scenario_id':scenario_id})
+
+        self.open_journal(network_id, scenario_id, importer.template.id)
+
+        node_name_id_map = importer.node_name_id_map()
+        importer.build_resource_attr_index()
+
+        prmnames = [f['properties']['prmname'] for f in importer.data_features(node_name_id_map)
+                    if has_extras(f['properties'])]
+        self.status.update(nodes_total=len(prmnames))
+        write_output("Backfilling the timeseries of %s nodes"%len(prmnames))
+
+        uploaded = self.journal.uploaded
+        #The conversion processes are started before the uploader's threads.
+        with importer.conversion_processes():
+            uploader = importer.make_uploader(scenario_id)
+            try:
+                nodes_done = 0
+                for resource_scenarios in importer.extras_pipeline(prmnames, node_name_id_map):
+                    for resource_scenario in resource_scenarios:
+                        if resource_scenario['resource_attr_id'] not in uploaded:
+                            uploader.add(resource_scenario)
+                    nodes_done += 1
+                    self.status.update(nodes_done=nodes_done,
+                                       values_uploaded=uploader.num_uploaded)
+            except:
+                uploader.abort()
+                raise
+
+            uploader.close()
+        self.status.update(values_uploaded=uploader.num_uploaded)
+
+        self.journal.finish()
+        if uploader.deduplicator is not None:
+            write_output(uploader.deduplicator.report())
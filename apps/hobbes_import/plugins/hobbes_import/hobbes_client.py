@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# hobbes_client is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# hobbes_client is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with hobbes_client.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+Access to the hobbes web API, shared by the importer and the template builder.
+"""
+
+import logging
+
+import json
+
+import gzip
+
+import hashlib
+
+import time
+
+import shutil
+
+import tempfile
+
+from contextlib import closing
+
+from decimal import Decimal
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import os
+
+from threading import Lock
+
+from HydraLib.HydraException import HydraPluginError
+
+from request_scheduler import RequestScheduler
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+log = logging.getLogger(__name__)
+
+HOBBES_URL = "http://cwn.casil.ucdavis.edu"
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.hobbes_cache')
+
+class HobbesCache(object):
+    """
+        A persistent on-disk cache of responses from the hobbes server, keyed
+        by request URL (and therefore by prmname for extras).
+
+        Each entry is a gzip-compressed body plus a small JSON file holding
+        the ETag and Last-Modified validators used to revalidate it.
+        Entries not used for longer than 'ttl' seconds are evicted, as are
+        the least recently used entries once the cache exceeds 'max_size' bytes.
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, ttl=7*24*3600,
+                 max_size=1024*1024*1024, max_age=0):
+
+        self.cache_dir = cache_dir
+        self.ttl       = ttl
+        self.max_size  = max_size
+        #Entries younger than this (in seconds) are used without revalidation.
+        self.max_age   = max_age
+
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        self.evict()
+
+    def _paths(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.cache_dir, key)
+        return base + '.json', base + '.gz'
+
+    def _replace(self, path, write):
+        """
+            Write a cache file atomically, so concurrent readers never see
+            a partially written entry.
+        """
+        #Each write has its own temporary file, as several threads may
+        #write the same entry at once.
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+        os.close(fd)
+        try:
+            write(tmp_path)
+            if os.name == 'nt':
+                #rename does not replace an existing file on Windows.
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            os.rename(tmp_path, path)
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get_meta(self, url):
+        """
+            Return the cached metadata for a url, or None if the url has
+            not been cached.
+        """
+        meta_path, body_path = self._paths(url)
+
+        if not (os.path.exists(meta_path) and os.path.exists(body_path)):
+            return None
+
+        try:
+            with open(meta_path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            log.warn("Ignoring corrupt cache entry for %s", url)
+            return None
+
+    def open(self, url):
+        """
+            Open the cached body of a url for reading. The body is decompressed
+            as it is read, so it never needs to be held in memory in full.
+        """
+        meta_path, body_path = self._paths(url)
+        return gzip.open(body_path, 'rb')
+
+    def is_fresh(self, meta):
+        return time.time() - meta['stored'] < self.max_age
+
+    def put(self, url, headers, body):
+        """
+            Store a response body, along with the validators from its headers.
+            The body may be a string or a file-like object, which is copied
+            into the cache in chunks.
+        """
+        meta_path, body_path = self._paths(url)
+
+        meta = dict(
+            url           = url,
+            etag          = headers.get('ETag'),
+            last_modified = headers.get('Last-Modified'),
+            stored        = time.time(),
+        )
+
+        def write_body(path):
+            with gzip.open(path, 'wb') as f:
+                if hasattr(body, 'read'):
+                    shutil.copyfileobj(body, f)
+                else:
+                    f.write(body)
+
+        def write_meta(path):
+            with open(path, 'w') as f:
+                json.dump(meta, f)
+
+        self._replace(body_path, write_body)
+        self._replace(meta_path, write_meta)
+
+    def touch(self, url):
+        """
+            Mark an entry as revalidated, restarting its max_age and ttl.
+        """
+        meta = self.get_meta(url)
+        if meta is None:
+            return
+        meta_path, body_path = self._paths(url)
+        meta['stored'] = time.time()
+
+        def write_meta(path):
+            with open(path, 'w') as f:
+                json.dump(meta, f)
+
+        self._replace(meta_path, write_meta)
+        os.utime(body_path, None)
+
+    def evict(self):
+        """
+            Remove expired entries, then the least recently used entries
+            until the cache fits within max_size.
+        """
+        now = time.time()
+        entries = []
+        total_size = 0
+        for filename in os.listdir(self.cache_dir):
+            if not filename.endswith('.gz'):
+                continue
+            body_path = os.path.join(self.cache_dir, filename)
+            meta_path = body_path[:-3] + '.json'
+            stat = os.stat(body_path)
+            if now - stat.st_mtime > self.ttl:
+                self._remove(meta_path, body_path)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, meta_path, body_path))
+            total_size += stat.st_size
+
+        entries.sort()
+        while total_size > self.max_size and len(entries) > 0:
+            mtime, size, meta_path, body_path = entries.pop(0)
+            self._remove(meta_path, body_path)
+            total_size -= size
+
+    def _remove(self, meta_path, body_path):
+        for path in (meta_path, body_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+class HobbesClient(object):
+    """
+        Makes requests to the hobbes server. All requests share one session,
+        so keep-alive connections are reused, and go through the cache when
+        one is given. The scheduler limits, and retries, the requests.
+    """
+    def __init__(self, url=HOBBES_URL, max_connections=8, cache=None, scheduler=None):
+
+        self.url   = url
+        self.cache = cache
+
+        if scheduler is None:
+            scheduler = RequestScheduler(max_connections=max_connections)
+        self.scheduler = scheduler
+
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=1,
+                                                  pool_maxsize=max_connections))
+
+        #Counters for the import metrics. Requests may be made from several
+        #threads at once, so they are updated under a lock.
+        self.lock = Lock()
+        self.num_requests   = 0
+        self.bytes_received = 0
+        self.parse_time     = 0.0
+
+    def _count(self, num_requests=0, bytes_received=0, parse_time=0.0):
+        with self.lock:
+            self.num_requests   += num_requests
+            self.bytes_received += bytes_received
+            self.parse_time     += parse_time
+
+    def parse(self, body):
+        """
+            Parse a JSON response body, recording the time taken.
+        """
+        start = time.time()
+        value = json.loads(body)
+        self._count(parse_time=time.time() - start)
+        return value
+
+    def open(self, path, revalidate=True):
+        """
+            Request a path from the hobbes server, returning a file-like object
+            from which the body of the response can be read incrementally.
+
+            A cached body is revalidated using its ETag and Last-Modified
+            headers, so an unchanged resource is not downloaded again. If
+            revalidate is False, a cached body is used without any request.
+        """
+        url = "%s/%s"%(self.url, path)
+
+        meta = None
+        headers = {}
+        if self.cache is not None:
+            meta = self.cache.get_meta(url)
+            if meta is not None:
+                if self.cache.is_fresh(meta) or revalidate is False:
+                    return self.cache.open(url)
+                if meta.get('etag') is not None:
+                    headers['If-None-Match'] = meta['etag']
+                if meta.get('last_modified') is not None:
+                    headers['If-Modified-Since'] = meta['last_modified']
+
+        response = self.scheduler.get(self.session, url, headers=headers, stream=True)
+        self._count(num_requests=1)
+
+        if response.status_code == 304 and meta is not None:
+            log.debug("%s not modified. Using cached copy.", url)
+            response.close()
+            self.cache.touch(url)
+            return self.cache.open(url)
+
+        if response.status_code != 200:
+            response.close()
+            raise HydraPluginError("A connection error has occurred with status code: %s"%response.status_code)
+
+        #Undo any content-encoding (gzip) applied by the server.
+        response.raw.decode_content = True
+
+        content_length = response.headers.get('Content-Length')
+        if content_length is not None:
+            self._count(bytes_received=int(content_length))
+
+        if self.cache is not None:
+            with closing(response):
+                self.cache.put(url, response.headers, response.raw)
+                if content_length is None:
+                    self._count(bytes_received=response.raw.tell())
+            return self.cache.open(url)
+
+        return response.raw
+
+    def get(self, path, revalidate=True):
+        """
+            Request a path from the hobbes server, returning the full body
+            of the response.
+        """
+        with closing(self.open(path, revalidate)) as f:
+            return f.read()
+
+    def get_network(self):
+        """
+            Request the hobbes network, as a list of GeoJSON features
+        """
+        return self.parse(self.get("network/get")) #JSON Network
+        #http://cwn.casil.ucdavis.edu/excel/create?prmname=SR_CLE    #XLS
+
+    def iter_network(self):
+        """
+            Parse the features of the hobbes network one at a time from the
+            response stream, without holding the full body or the full
+            list of features in memory.
+        """
+        if ijson is None:
+            raise HydraPluginError("Streaming the hobbes network requires the ijson package.")
+
+        with closing(self.open("network/get")) as f:
+            for feature in ijson.items(f, 'item'):
+                yield _decimals_to_floats(feature)
+
+    def get_extras(self, prmname, revalidate=True):
+        """
+            Request the extras (timeseries) of a single node
+        """
+        return self.parse(self.get_extras_body(prmname, revalidate)) #JSON attributes
+
+    def get_extras_body(self, prmname, revalidate=True):
+        """
+            Request the extras of a single node, without parsing them.
+        """
+        return self.get("network/extras?prmname=%s"%prmname, revalidate)
+
+def _decimals_to_floats(value):
+    """
+        ijson parses non-integer numbers as Decimals, whereas json.loads
+        returns floats. Convert them so both parsers produce the same values.
+    """
+    if isinstance(value, Decimal):
+        return float(value)
+    elif isinstance(value, dict):
+        return dict((k, _decimals_to_floats(v)) for k, v in value.items())
+    elif isinstance(value, list):
+        return [_decimals_to_floats(v) for v in value]
+    return value
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# hobbes_geometry is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# hobbes_geometry is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with hobbes_geometry.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+Node coordinates: where each hobbes node is, and its position in the
+coordinate reference system (CRS) of the hydra network.
+
+Hobbes serves GeoJSON, so coordinates are longitude and latitude (EPSG:4326).
+All the coordinates of a network are reprojected at once, as arrays. Other
+than to Web Mercator (EPSG:3857), reprojection requires the pyproj package.
+"""
+
+import logging
+
+import numpy as np
+
+from HydraLib.HydraException import HydraPluginError
+
+try:
+    import pyproj
+except ImportError:
+    pyproj = None
+
+log = logging.getLogger(__name__)
+
+HOBBES_CRS = 'EPSG:4326'
+WEB_MERCATOR = 'EPSG:3857'
+
+#The radius of the sphere used by Web Mercator, in metres
+EARTH_RADIUS = 6378137.0
+
+def node_coordinates(feature):
+    """
+        The x (longitude) and y (latitude) of a hobbes feature. A node should
+        be a single point, but some hobbes nodes have a list of points (or a
+        point nested in a list). These are all placed at their first point.
+    """
+    coords = feature['geometry']['coordinates']
+    while isinstance(coords[0], (list, tuple)):
+        coords = coords[0]
+
+    return float(coords[0]), float(coords[1])
+
+def _normalise(crs):
+    return crs.strip().upper()
+
+def _to_web_mercator(x, y):
+    return (np.radians(x) * EARTH_RADIUS,
+            np.log(np.tan(np.pi / 4 + np.radians(y) / 2)) * EARTH_RADIUS)
+
+class CoordinateTransform(object):
+    """
+        Reprojects arrays of coordinates from source_crs to target_crs, each
+        given as an 'EPSG:<code>' string. Coordinates are always in x, y
+        (longitude, latitude) order, whatever the axis order of the CRS.
+    """
+    def __init__(self, source_crs=HOBBES_CRS, target_crs=HOBBES_CRS):
+        self.source_crs = _normalise(source_crs)
+        self.target_crs = _normalise(target_crs)
+
+        self.func = None
+        if self.is_identity():
+            return
+
+        if (self.source_crs, self.target_crs) == (HOBBES_CRS, WEB_MERCATOR):
+            self.func = _to_web_mercator
+        elif pyproj is None:
+            raise HydraPluginError("Reprojecting from %s to %s requires the pyproj package."
+                                   % (self.source_crs, self.target_crs))
+        elif hasattr(pyproj, 'Transformer'):
+            self.func = pyproj.Transformer.from_crs(self.source_crs, self.target_crs,
+                                                    always_xy=True).transform
+        else:
+            #Before pyproj 2, coordinates are always x, y.
+            source = pyproj.Proj(init=self.source_crs.lower())
+            target = pyproj.Proj(init=self.target_crs.lower())
+            self.func = lambda x, y: pyproj.transform(source, target, x, y)
+
+    def is_identity(self):
+        return self.source_crs == self.target_crs
+
+    def transform(self, x, y):
+        """
+            Reproject arrays of x and y coordinates, returning new arrays.
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if self.func is None or len(x) == 0:
+            return x, y
+
+        x, y = self.func(x, y)
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+
+        num_invalid = np.count_nonzero(~(np.isfinite(x) & np.isfinite(y)))
+        if num_invalid > 0:
+            log.warn("%s coordinates could not be projected to %s",
+                     num_invalid, self.target_crs)
+
+        return x, y
+
+    def transform_point(self, x, y):
+        x, y = self.transform([x], [y])
+        return float(x[0]), float(y[0])
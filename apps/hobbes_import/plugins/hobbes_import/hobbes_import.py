@@ -45,6 +45,119 @@ Option                 Short  Parameter    Description
 ``--session-id``       ``-c`` SESSION-ID   Session ID used by the calling software.
                                            If left empty, the plugin will attempt
                                            to log in itself.
+``--hobbes-url``              HOBBES_URL   Url of the hobbes server. Defaults to
+                                           http://cwn.casil.ucdavis.edu.
+``--max-connections``  ``-w`` MAX_CONN     Maximum number of concurrent requests
+                                           made to the hobbes server. Defaults
+                                           to 8.
+``--timeout``                 TIMEOUT      Seconds to wait for a response from the
+                                           hobbes server. Defaults to 60.
+``--max-retries``             RETRIES      Times a failed request to the hobbes
+                                           server is retried. Defaults to 5.
+``--max-rate``                RATE         Maximum requests per second made to
+                                           the hobbes server. Defaults to no
+                                           limit.
+``--convert-workers``         WORKERS      Threads (or processes) converting
+                                           timeseries. Defaults to 2.
+``--timeseries-encoding``     ENCODING     'json' to send timeseries in the form
+                                           hydra reads, or 'compact' to send
+                                           them as a start and frequency, or as
+                                           arrays of dates and values. Defaults
+                                           to 'json'.
+``--parse-mode``              MODE         'thread' to convert timeseries in
+                                           threads, or 'process' to convert
+                                           them in a pool of processes, using
+                                           more than one core. Defaults to
+                                           'thread'.
+``--build-workers``           WORKERS      Threads building datasets from the
+                                           converted timeseries. Defaults to 2.
+``--upload-workers``          WORKERS      Threads uploading batches to Hydra.
+                                           Defaults to 1.
+``--cache-dir``               CACHE_DIR    Directory in which responses from the
+                                           hobbes server are cached. Defaults to
+                                           ~/.hobbes_cache.
+``--no-cache``                             Do not cache responses from the
+                                           hobbes server.
+``--stream``           ``-s``              Parse the hobbes network incrementally
+                                           instead of holding it in memory.
+                                           Requires the ijson package.
+``--network-id``              NETWORK_ID   Sync a network previously imported
+                                           from hobbes, sending only what has
+                                           changed.
+``--scenario-id``             SCENARIO_ID  The scenario to update when syncing.
+``--watch``                                Keep syncing the network given by
+                                           --network-id, polling hobbes for
+                                           changes until interrupted.
+``--poll-interval``           SECONDS      Seconds between polls when watching.
+                                           Defaults to 300.
+``--watch-status``            STATUS_FILE  JSON file to which the lag and
+                                           throughput counters are written
+                                           after each poll when watching.
+``--background-timeseries``                With -t, import the topology and
+                                           scalars, then return and backfill
+                                           the timeseries in a background
+                                           process.
+``--backfill``                             Backfill the timeseries of the
+                                           network and scenario given by
+                                           --network-id and --scenario-id,
+                                           resuming an interrupted backfill.
+``--backfill-progress``                    Report the progress of the last
+                                           backfill, instead of importing.
+``--backfill-journal``        JOURNAL      File recording the progress of the
+                                           backfill. Defaults to
+                                           ~/.hobbes_backfill.journal.
+``--backfill-status``         STATUS_FILE  JSON file holding the progress of the
+                                           backfill. Defaults to
+                                           ~/.hobbes_backfill.json.
+``--journal``                 JOURNAL      Record the progress of the import in
+                                           this file, so it can be resumed.
+                                           Nothing is recorded if it is not
+                                           given.
+``--resume``           ``-r``              Resume the interrupted import recorded
+                                           in the journal. Defaults to
+                                           ~/.hobbes_import.journal.
+``--dedup``            ``-d``              Send each distinct dataset only once.
+``--batch-size``       ``-b`` BATCH_SIZE   Number of resource scenarios uploaded
+                                           to Hydra in each request. Defaults
+                                           to 500.
+``--shard-nodes``             NODES        Maximum nodes whose data is imported
+                                           in each shard. Defaults to 200.
+``--shard-mb``                MB           Maximum estimated megabytes of data
+                                           in each shard. Defaults to 50.
+``--shard-workers``           WORKERS      Shards imported at once. Defaults
+                                           to 2.
+``--max-nodes``               MAX_NODES    Import the data of only the first
+                                           MAX_NODES nodes. Defaults to all.
+``--template-cache``          TMPL_CACHE   File recording the template built for
+                                           each hobbes schema, so an unchanged
+                                           schema reuses its template. Defaults
+                                           to ~/.hobbes_templates.json.
+``--no-template-cache``                    Always build and upload a new
+                                           template.
+``--template-file``           TMPL_FILE    File to which the generated template
+                                           is also written.
+``--make-snapshot``           SNAPSHOT     Download the hobbes network and the
+                                           extras of every node to a snapshot
+                                           file, instead of importing.
+``--snapshot``                SNAPSHOT     Import from a snapshot file instead
+                                           of the hobbes server.
+``--region``                  REGION       Import only the nodes in this region.
+                                           May be given more than once.
+``--upstream-of``             PRMNAME      Import only the nodes upstream of
+                                           this node.
+``--downstream-of``           PRMNAME      Import only the nodes downstream of
+                                           this node.
+``--source-crs``              CRS          The CRS of the hobbes coordinates.
+                                           Defaults to EPSG:4326 (longitude and
+                                           latitude).
+``--target-crs``              CRS          The CRS of the hydra network, to
+                                           which the coordinates of its nodes
+                                           are reprojected. Defaults to
+                                           EPSG:4326. Other than EPSG:3857,
+                                           reprojection requires the pyproj
+                                           package.
+``--metrics-file``            METRICS_FILE JSON file to which the time and I/O of
+                                           each phase of the import are written.
 ====================== ====== ============ =========================================
 
 """
@@ -57,12 +170,37 @@ from HydraLib.PluginLib import JsonConnection
 from HydraLib.HydraException import HydraPluginError
 from HydraLib.PluginLib import write_progress, write_output, validate_plugin_xml, RequestError
 
-from create_hobbes_template import HobbesTemplateBuilder 
+from create_hobbes_template import HobbesTemplateBuilder, TemplateCache, schema_fingerprint, template_fingerprint
+from create_hobbes_template import DEFAULT_TEMPLATE_CACHE, TEMPLATE_NAME, NON_ATTRIBUTES
+from hobbes_client import HobbesClient, HobbesCache, DEFAULT_CACHE_DIR, HOBBES_URL
+from scenario_upload import ScenarioUploader
+from dataset_dedup import DatasetDeduplicator
+from hobbes_timeseries import parse_timeseries, convert_extras, convert_extras_body, ENCODINGS
+from hobbes_sync import HobbesSync, has_extras
+from hobbes_journal import ImportJournal, DEFAULT_JOURNAL
+from hobbes_metrics import ImportMetrics, MeteredConnection
+from hobbes_subset import NetworkSubset
+from hobbes_snapshot import SnapshotClient, make_snapshot
+from hobbes_topology import NetworkTopology
+from hobbes_geometry import CoordinateTransform, HOBBES_CRS
+from request_scheduler import RequestScheduler
+from hobbes_pipeline import Pipeline, Stage
+from hobbes_shards import plan_shards, node_sizes
+from hobbes_watch import HobbesWatcher
+from hobbes_backfill import HobbesBackfill, BackfillStatus, start_backfill, read_status, describe_status
+from hobbes_backfill import DEFAULT_BACKFILL_JOURNAL, DEFAULT_BACKFILL_STATUS, SESSION_ENV
 from HydraLib import config
 
 import json
 
-import requests
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+
+from itertools import islice
+
+from contextlib import contextmanager
+
+from threading import Event
 
 import os, sys
 
@@ -76,30 +214,80 @@ class HobbesImporter(object):
     """
        Importer of JSON files into Hydra. Also accepts XML files.
     """
-    def __init__(self, url=None, session_id=None):
+    def __init__(self, url=None, session_id=None, max_connections=8, cache=None, stream=False,
+                 batch_size=500, journal=None, dedup=False, hobbes_url=HOBBES_URL,
+                 count_hydra_bytes=False, subset=None, snapshot=None, scheduler=None,
+                 convert_workers=2, build_workers=2, upload_workers=1, parse_mode='thread',
+                 timeseries_encoding='json', shard_nodes=200, shard_mb=50,
+                 shard_workers=2, max_nodes=None, source_crs=HOBBES_CRS,
+                 target_crs=HOBBES_CRS):
 
         self.json_net = None
+        #In stream mode, the network is parsed from the response each time it
+        #is needed instead of being kept in json_net.
+        self.stream = stream
+        #The number of resource scenarios uploaded to hydra in each request
+        self.batch_size = batch_size
+        #Records progress, so an interrupted import can be resumed
+        self.journal = journal
+        #Send each distinct dataset only once
+        self.dedup = dedup
+        #The part of the network to import, if not all of it
+        self.subset = subset
+        #The threads in each stage of the timeseries import, after fetching
+        self.convert_workers = convert_workers
+        self.build_workers   = build_workers
+        self.upload_workers  = upload_workers
+        #Whether timeseries are converted in threads or in processes
+        self.parse_mode = parse_mode
+        #The processes which convert timeseries, shared by every pipeline
+        self.process_pool = None
+        #How converted timeseries are encoded (see hobbes_timeseries)
+        self.timeseries_encoding = timeseries_encoding
+        #The limits of each shard of the data import, and how many shards
+        #are imported at once
+        self.shard_nodes   = shard_nodes
+        self.shard_mb      = shard_mb
+        self.shard_workers = shard_workers
+        #Import the data of only this many nodes, if set
+        self.max_nodes = max_nodes
+        #Reprojects the coordinates of nodes to the CRS of the hydra network
+        self.geometry = CoordinateTransform(source_crs, target_crs)
 
         self.warnings = []
         self.files    = []
         self.template = None
         self.attributes = []
         self.attr_name_map = {}
+        self.type_index = {}
 
-        self.nodes = {}
-        self.links = {}
+        self.topology = NetworkTopology()
         self.groups = {}
         
         self.node_id  = PluginLib.temp_ids()
         self.link_id  = PluginLib.temp_ids()
         self.group_id  = PluginLib.temp_ids()
 
+        self.max_connections = max_connections
+        if snapshot is not None:
+            self.client = SnapshotClient(snapshot)
+        else:
+            self.client = HobbesClient(url=hobbes_url,
+                                       max_connections=max_connections,
+                                       cache=cache,
+                                       scheduler=scheduler)
+
+        self.url = url
         self.connection = JsonConnection(url)
         if session_id is not None:
             write_output("Using existing session %s"% session_id)
             self.connection.session_id=session_id
         else:
             self.connection.login()
+        #Counts the calls made to hydra, for the metrics of each phase
+        self.connection = MeteredConnection(self.connection,
+                                            count_bytes=count_hydra_bytes)
+        self.metrics = ImportMetrics(self.client, self.connection)
 
         #3 steps: start, read, save 
         self.num_steps = 3
@@ -140,9 +328,38 @@ class HobbesImporter(object):
         self.attributes = self.connection.call('get_template_attributes',
                                                {'template_id':int(template_id)})
 
+        self.index_template()
+
+    def index_template(self):
+        """
+            Build the lookups by name of the template's attributes, and of
+            its types along with the attribute IDs of each type, so resources
+            can be typed without searching the template.
+        """
         #Build a lookup dict of attributes by name
+        self.attr_name_map = {}
         for a in self.attributes:
             self.attr_name_map[a.name] = a
+
+        self.type_index = {}
+        for t in self.template.types:
+            self.type_index[t.name] = (t.id, [tattr.attr_id for tattr in t.typeattrs])
+
+    def get_type(self, type_name):
+        """
+            Return the types and attributes of a resource of the named type,
+            in the form hydra expects them.
+        """
+        if type_name not in self.type_index:
+            raise HydraPluginError("Type %s not found in template %s"
+                                   % (type_name, self.template.id))
+
+        type_id, attr_ids = self.type_index[type_name]
+
+        types = [{'template_id':self.template.id, 'id':type_id}]
+        attributes = [{'attr_id':attr_id} for attr_id in attr_ids]
+
+        return types, attributes
             
     def fetch_remote_network(self):
         """
@@ -151,111 +368,165 @@ class HobbesImporter(object):
         write_output("Fetching Network") 
         write_progress(2, self.num_steps)
 
-        net_response = requests.get("http://cwn.casil.ucdavis.edu/network/get") #JSON Network
-        #http://cwn.casil.ucdavis.edu/excel/create?prmname=SR_CLE    #XLS
+        if self.stream is True:
+            #The features are parsed as they are needed, in iter_network
+            return
+
+        self.json_net = self.client.get_network()
+
+    def iter_network(self):
+        """
+            Iterate over the features of the hobbes network. In stream mode,
+            each feature is parsed from the response as it is reached, so
+            memory use does not grow with the size of the network. When a
+            cache is in use, only the first pass downloads anything.
+        """
+        if self.stream is True:
+            return self.client.iter_network()
+
+        if self.json_net is None:
+            self.fetch_remote_network()
+
+        return iter(self.json_net)
 
-        if net_response.status_code != 200:
-            raise HydraPluginError("A connection error has occurred with status code: %s"%net_response.status_code)
+    def fetch_node_extras(self, prmname, raw=False):
+        """
+            Request the extras (timeseries) of a single node from the hobbes server.
+            If raw is set, the body of the response is returned unparsed.
+        """
+        get_extras = self.client.get_extras
+        if raw is True:
+            get_extras = self.client.get_extras_body
+
+        if self.journal is None:
+            return get_extras(prmname)
+
+        #Extras fetched before an import was interrupted are read straight
+        #from the cache when it is resumed.
+        extra_data = get_extras(prmname,
+                                revalidate=prmname not in self.journal.fetched)
+        self.journal.record_extras(prmname)
 
-        self.json_net = json.loads(net_response.content)
+        return extra_data
 
-    def upload_template(self):
+    def resume(self):
         """
-            Upload the template file found in ./template.xml
+            Load the network, template and scenario of an interrupted import
+            from the journal, returning the scenario to continue importing into.
         """
-        file_ = os.path.join(__location__, '../', 'template', 'template.xml')
+        self.journal.load()
 
-        with open(file_) as f:
-            xml_template = f.read()
+        self.fetch_template(self.journal.template_id)
 
+        self.network = self.connection.call('get_network',
+                                            {'network_id':self.journal.network_id,
+                                             'include_data':'N'})
+
+        return self.connection.call('get_scenario',
+                                    {'scenario_id':self.journal.scenario_id})
+
+    def upload_template(self, xml_template):
+        """
+            Upload a template, as generated by the template builder.
+        """
         self.template = self.connection.call('upload_template_xml',
                                     {'template_xml':xml_template})
 
         self.attributes = self.connection.call('get_template_attributes',
                                                {'template_id':self.template.id})
 
-        #Build a lookup dict of attributes by name
-        for a in self.attributes:
-            self.attr_name_map[a.name] = a
+        self.index_template()
             
+    def build_template(self, template_cache=None, template_file=None):
+        """
+            Build a template from the hobbes network and upload it, unless
+            the template cache records a template built from the same schema
+            on this hydra server, in which case that template is used.
+            The template is also written to template_file, if one is given.
+        """
+        tmpl = HobbesTemplateBuilder(client=self.client)
+        template_struct = tmpl.build_template_struct(self.iter_network())
+        fingerprint = schema_fingerprint(template_struct)
+
+        #Keyed on the URL of the connection, which is set from the config
+        #when no URL is given.
+        server_url = self.connection.url
+        if template_cache is not None:
+            template_id = template_cache.get(server_url, fingerprint)
+            if template_id is not None:
+                try:
+                    self.fetch_template(template_id)
+                except RequestError:
+                    log.warn("Template %s not found. Building a new one.", template_id)
+                    template_cache.remove(server_url, fingerprint)
+                else:
+                    if self.template.name == TEMPLATE_NAME and \
+                            template_fingerprint(self.template, self.attributes) == fingerprint:
+                        write_output("Schema unchanged. Using template %s"%template_id)
+                        return
+                    log.warn("Template %s is not the template of this schema. Building a new one.",
+                             template_id)
+                    template_cache.remove(server_url, fingerprint)
+
+        xml_template = tmpl.convert(template_struct=template_struct,
+                                    output=template_file)
+        self.upload_template(xml_template)
+
+        if template_cache is not None:
+            template_cache.put(server_url, fingerprint, self.template.id)
+
+    def build_topology(self, features, node_ids=None):
+        """
+            Build the nodes of the features, reprojected to the CRS of the
+            network, and the links between them. Nodes are given their ID in
+            node_ids, by name, if they have one, or else a new temporary ID.
+        """
+        topology = NetworkTopology()
+        for feature in features:
+            props = feature['properties']
+
+            #Check the type now, rather than once the project has been created.
+            if props['type'] not in self.type_index:
+                self.get_type(props['type'])
+
+            node_id = None
+            if node_ids is not None:
+                node_id = node_ids.get(props['prmname'])
+            if node_id is None:
+                node_id = self.node_id.next()
+
+            row = topology.add_node(feature, node_id)
+            topology.add_links(props, row, self.link_id)
+
+        #All the nodes are reprojected together, once they have been read.
+        topology.reproject(self.geometry)
+
+        return topology
+
     def import_network_topology(self, project_id=None):
         """
             Read the file containing the network data and send it to
-            the server.
+            the server. If a subset is given, only its nodes, the links
+            between them and its groups are sent.
         """
 
-        if self.json_net is None:
-            self.fetch_remote_network()
+        selected = None
+        if self.subset is not None:
+            selected = self.subset.select(self.iter_network())
+            write_output("Importing %s nodes"%len(selected))
 
-        for node in self.json_net:
-            props = node['properties']
-            node_type = props['type']
-            node_coords = node['geometry']['coordinates']
-            
-            tmp_node_id = self.node_id.next()
-
-            #TODO: HACK. WHy are there 2 coordinates for the node?
-            if isinstance(node_coords[0], list):
-                #log.debug("Using 1st coords of %s (%s)", node_coords, props['type'])
-                node_coords = node_coords[0]
-
-            #log.info("X=%s, y=%s",node_coords[0], node_coords[1]) 
-            node = dict(
-                id = tmp_node_id,
-                name = props['prmname'],
-                x = str(node_coords[0]), #swap these if they are lat-long, not x-y
-                y = str(node_coords[1]),
-                description = props['description'],
-                attributes = [],
-                types = [{'template_id':self.template.id,
-                          'id':node_type}]
-            )
-            self.nodes[props['prmname']] = node
-
-            #ATTRIBUTES
-
-            #Find the matching type
-            for t in self.template.types:
-                if t.name == node_type:
-                    node['types'][0]['id'] = t.id
-                    #Assign the attributes to the node
-                    for tattr in t.typeattrs:
-                        node['attributes'].append(
-                            {'attr_id':tattr.attr_id}
-                        )
-
-            inlinks = [o['link_prmname'] for o in props.get('origins', [])]
-            for linkname in inlinks:
-                if linkname not in self.links:
-                    link = dict(
-                        id=self.link_id.next(),
-                        name = linkname,
-                        node_2_id = tmp_node_id,
-                        attributes = [],
-                        description = "",
-                    )
-                    self.links[linkname] = link
-                else:
-                    link = self.links[linkname]
-                    link['node_2_id'] = tmp_node_id
-
-
-            outlinks = [o['link_prmname'] for o in props.get('terminals', [])]
-            for linkname in outlinks:
-                if linkname not in self.links:
-                    link = dict(
-                        id=self.link_id.next(),
-                        name = linkname,
-                        node_1_id = tmp_node_id,
-                        attributes = [],
-                        description = "",
-                    )
-                    self.links[linkname] = link
-                else:
-                    link = self.links[linkname]
-                    link['node_1_id'] = tmp_node_id
+        features = self.iter_network()
+        if selected is not None:
+            features = (f for f in features if f['properties']['prmname'] in selected)
+        self.topology = topology = self.build_topology(features)
 
-            node_groups = props['regions']
+        if selected is not None:
+            for group_name in self.subset.members:
+                self.groups[group_name] = dict(
+                    id          = self.group_id.next(),
+                    name        = group_name,
+                    description = self.subset.descriptions[group_name],
+                )
 
         project = self.fetch_project(project_id)
         project_id = project.id
@@ -263,26 +534,77 @@ class HobbesImporter(object):
         write_output("Saving Network") 
         write_progress(3, self.num_steps) 
 
-        for t in self.template.types:
-            if t.name == 'HobbesNetwork':
-                network_type = t.id
+        network_types, network_attributes = self.get_type('HobbesNetwork')
         hydra_network = {
             'name' : "HOBBES Network (%s)"%datetime.now(),
             'description' : "Hobbes Network, imported directly from the web API",
-            'nodes': self.nodes.values(),
-            'links': self.links.values(),
+            'nodes': topology.node_dicts(self.get_type),
+            #Leave out the links to nodes outside the subset
+            'links': topology.link_dicts(self.get_type,
+                                         complete_only=selected is not None),
             'project_id' : project_id,
-            'projection':'EPSG:2229',
-            'groups'   : [],
+            'projection': self.geometry.target_crs,
+            'resourcegroups': self.groups.values(),
             'scenarios': [],
-            'types'    : [{'template_id':self.template.id,
-                          'id':network_type}]
+            'attributes': network_attributes,
+            'types'    : network_types,
         }
 
         #The network ID can be specified to get the network...
         self.network = self.connection.call('add_network', {'net':hydra_network})
         return self.network
     
+    def make_group_items(self):
+        """
+            Make the items which put the nodes of a subset in its groups.
+        """
+        if self.subset is None:
+            return []
+
+        group_ids = dict((g.name, g.id) for g in self.network.resourcegroups)
+        node_ids  = dict((n.name, n.id) for n in self.network.nodes)
+
+        items = []
+        for group_name, members in self.subset.members.items():
+            for prmname in members:
+                items.append(dict(
+                    ref_key  = 'NODE',
+                    ref_id   = node_ids[prmname],
+                    group_id = group_ids[group_name],
+                ))
+        return items
+
+    def build_resource_attr_index(self):
+        """
+            Build a lookup from (ref_key, ref_id, attr_id) to resource attribute ID
+            for all the nodes and links in the network, and the network itself,
+            so each value can find its resource attribute without a search.
+        """
+        self.resource_attr_index = {}
+
+        node_attributes = self.connection.call('get_all_node_attributes', {'network_id':self.network.id})
+        for a in node_attributes:
+            self.resource_attr_index[('NODE', a.ref_id, a.attr_id)] = a.id
+
+        link_attributes = self.connection.call('get_all_link_attributes', {'network_id':self.network.id})
+        for a in link_attributes:
+            self.resource_attr_index[('LINK', a.ref_id, a.attr_id)] = a.id
+
+        for a in self.network.attributes:
+            self.resource_attr_index[('NETWORK', self.network.id, a.attr_id)] = a.id
+
+    def get_resource_attr_id(self, ref_key, ref_id, attr_id):
+        """
+            Find the resource attribute of attribute attr_id on a resource.
+            Raises an error if the resource does not have that attribute,
+            rather than uploading data with no resource attribute.
+        """
+        try:
+            return self.resource_attr_index[(ref_key, ref_id, attr_id)]
+        except KeyError:
+            raise HydraPluginError("%s %s has no attribute with ID %s. Does the template match the hobbes network?"
+                                   % (ref_key.lower(), ref_id, attr_id))
+
     def make_repo_dataset(self, json_repo):
 
         meta = {}
@@ -300,160 +622,382 @@ class HobbesImporter(object):
 
         return dataset
 
-    def import_data(self, include_timeseries=True):
+    def import_data(self, include_timeseries=True, new_scenario=None):
+        """
+            Create the 'Hobbes Import' scenario, then upload the data of
+            each node to it in batches, so the full set of resource scenarios
+            is never held in memory or sent in a single request.
 
-        scenario = {
-            "name" : "Hobbes Import",
-            "description" : "Import from hobbes",
-        }
+            The nodes are divided into shards, which are imported
+            shard_workers at a time.
 
-        #List of parameters to ignore
-        non_attributes = set(['origins', 'prmname', 'regions', 'terminals', 'description', 'extras', 'type', 'repo', 'origin'])
+            When resuming an import, the existing scenario is passed in, and
+            the data the journal records as uploaded is skipped.
+        """
 
-        #Make a map from node name to a list of attributes. Do this by first
-        #making a node id map
-        node_name_id_map = {}
-        for n in self.network.nodes:
-            node_name_id_map[n.name] = n.id
+        if new_scenario is None:
+            scenario = {
+                "name" : "Hobbes Import",
+                "description" : "Import from hobbes",
+                "resourcescenarios" : [],
+                "resourcegroupitems" : self.make_group_items(),
+            }
 
-        node_attributes = self.connection.call('get_all_node_attributes', {'network_id':self.network.id})
+            new_scenario = self.connection.call('add_scenario', 
+                                                   {'network_id':self.network.id,
+                                                    'scen':scenario
+                                                   })
 
-        node_id_attr_map = {}
-        for a in node_attributes:
-            n_attrs = node_id_attr_map.get(a.ref_id, [])
-            n_attrs.append(a)
-            node_id_attr_map[a.ref_id] = n_attrs
+            if self.journal is not None:
+                self.journal.start(self.network.id, new_scenario.id, self.template.id)
 
-        resource_scenarios = []
-        #request data for first 2 nodes.
-        for node in self.json_net[:10]:
+        node_name_id_map = self.node_name_id_map()
+        self.build_resource_attr_index()
+
+        shards = plan_shards(node_sizes(self.data_features(node_name_id_map),
+                                        include_timeseries),
+                             max_nodes=self.shard_nodes,
+                             max_size=self.shard_mb * 1024 * 1024)
+
+        #One deduplicator is shared, so a dataset is sent once across all shards.
+        deduplicator = None
+        if self.dedup is True:
+            deduplicator = DatasetDeduplicator()
+
+        with self.conversion_processes():
+            self.import_shards(shards, new_scenario.id, node_name_id_map,
+                               include_timeseries, deduplicator)
+
+        if self.journal is not None:
+            self.journal.finish()
+
+        if deduplicator is not None:
+            write_output(deduplicator.report())
+
+        self.scenario = new_scenario
+        return new_scenario
+
+    def import_shards(self, shards, scenario_id, node_name_id_map,
+                      include_timeseries=True, deduplicator=None):
+        """
+            Import the data of each shard, each with its own uploader, running
+            shard_workers shards at once. The features of a shard are read
+            from the network when it starts. Progress is reported as each
+            shard completes. If a shard fails, the others stop and its error is
+            raised.
+        """
+        if len(shards) == 0:
+            return
+
+        uploaded = set()
+        if self.journal is not None:
+            uploaded = self.journal.uploaded
+
+        stopped = Event()
+
+        def import_shard(shard):
+            uploader = self.make_uploader(scenario_id, deduplicator)
+            features = self.shard_features(shard, node_name_id_map)
+            try:
+                for resource_scenario in self.node_resource_scenarios(features,
+                                                                      node_name_id_map,
+                                                                      include_timeseries):
+                    if stopped.is_set():
+                        raise HydraPluginError("Shard %s stopped, as another shard failed"
+                                               % (shard.index + 1))
+                    if resource_scenario['resource_attr_id'] in uploaded:
+                        continue
+                    uploader.add(resource_scenario)
+            except:
+                stopped.set()
+                uploader.abort()
+                raise
+
+            uploader.close()
+            return shard, uploader.num_uploaded
+
+        write_output("Importing the data of %s nodes in %s shards"
+                     % (sum(len(s) for s in shards), len(shards)))
+
+        pool = ThreadPool(min(self.shard_workers, len(shards)))
+        try:
+            results = pool.imap_unordered(import_shard, shards)
+            for num_done, (shard, num_uploaded) in enumerate(results, 1):
+                write_output("Shard %s of %s complete: %s nodes, %s values uploaded"
+                             % (shard.index + 1, len(shards), len(shard), num_uploaded))
+                write_progress(num_done, len(shards))
+        finally:
+            #Stop any running shards if one has failed, before waiting for them.
+            stopped.set()
+            pool.close()
+            pool.join()
+
+    def shard_features(self, shard, node_name_id_map):
+        """
+            Read the features of the nodes of a shard from the network again,
+            stopping once all of them have been found. When streaming, this
+            is a pass over the network (from the cache, if there is one).
+        """
+        remaining = set(shard.prmnames)
+        for feature in self.data_features(node_name_id_map):
+            if len(remaining) == 0:
+                break
+            prmname = feature['properties']['prmname']
+            if prmname in remaining:
+                remaining.remove(prmname)
+                yield feature
+
+        if len(remaining) > 0:
+            log.warn("%s nodes of shard %s are no longer in the hobbes network",
+                     len(remaining), shard.index + 1)
+
+    def make_uploader(self, scenario_id, deduplicator=None):
+        """
+            Make the uploader which sends data to a scenario, recording each
+            batch in the journal and removing duplicate datasets, if required.
+        """
+        on_upload = None
+        if self.journal is not None:
+            on_upload = self.journal.record_batch
+
+        if deduplicator is None and self.dedup is True:
+            deduplicator = DatasetDeduplicator()
+
+        return ScenarioUploader(self.connection,
+                                scenario_id,
+                                batch_size=self.batch_size,
+                                on_upload=on_upload,
+                                deduplicator=deduplicator,
+                                workers=self.upload_workers)
+
+    def node_name_id_map(self):
+        return dict((n.name, n.id) for n in self.network.nodes)
+
+    def data_features(self, node_name_id_map):
+        """
+            The features of the hobbes network which are nodes of the hydra
+            network, up to max_nodes of them if it is set.
+        """
+        features = (f for f in self.iter_network()
+                    if f['properties']['prmname'] in node_name_id_map)
+        if self.max_nodes is not None:
+            features = islice(features, self.max_nodes)
+        return features
+
+    def build_resource_scenarios(self, include_timeseries=True, features=None):
+        """
+            Generate the resource scenarios for the data of each node. By
+            default this is every node of the hobbes network which is in the
+            hydra network, but a list of features can be given to import the
+            data of only those nodes.
+        """
+
+        node_name_id_map = self.node_name_id_map()
+
+        self.build_resource_attr_index()
+
+        if features is None:
+            features = self.data_features(node_name_id_map)
+
+        return self.node_resource_scenarios(features, node_name_id_map, include_timeseries)
+
+    def node_resource_scenarios(self, features, node_name_id_map, include_timeseries=True):
+        """
+            Generate the resource scenarios for the data of the nodes of
+            the given features, whose IDs are in node_name_id_map.
+        """
+        #Nodes whose extras must be requested from the hobbes server.
+        extras_nodes = []
+        for node in features:
             props = node['properties']
             name  = props['prmname'] 
             node_id = node_name_id_map[name]
 
-            #repo is a special case
-            repo = self.make_repo_dataset(props['repo'])
-            repo_attr_id = self.attr_name_map['repo'].id
-            ra_id = None
-            for a in node_id_attr_map[node_id]:
-                if a.attr_id == repo_attr_id:
-                    ra_id = a.id
-                    break
-
-            repo_rs = dict(
-                resource_attr_id = ra_id,
-                attr_id          = repo_attr_id,
-                is_var           = 'N',
-                value            = repo,
-            )
-            resource_scenarios.append(repo_rs)
-
-            for k, v in props.items():
-                if k not in non_attributes:
-                    if isinstance(v, float):
-                        attr_id = self.attr_name_map[k].id
-                        dataset = dict(
-                            name = k,
-                            value = str(v),
-                            type        = 'scalar',
-                            dimension   = 'dimensionless',
-                            unit        = None,
-                        )
-
-                        ra_id = None
-                        for a in node_id_attr_map[node_id]:
-                            if a.attr_id == attr_id:
-                                ra_id = a.id
-                                break
-
-                        resource_scenario = dict(
-                            resource_attr_id = ra_id,
-                            attr_id          = attr_id,
-                            is_var           = 'N',
-                            value            = dataset,
-                        )
-
-                        resource_scenarios.append(resource_scenario)
+            for resource_scenario in self.build_node_data(props, node_id):
+                yield resource_scenario
 
             #timeseries, requested from the hobbes server
-            if include_timeseries is True:
-                extras = props.get('extras', [])
-                
-                if extras is not None and len(extras) > 0:
-                    attr_response = requests.get("http://cwn.casil.ucdavis.edu/network/extras?prmname=%s"%props['prmname']) #JSON attributes
-                else:
-                    continue
-                
-                if attr_response.status_code != 200:
-                    raise HydraPluginError("A connection error has occurred with status code: %s"%attr_response.status_code)
+            if include_timeseries is True and has_extras(props):
+                extras_nodes.append(name)
+
+        #The extras are fetched, converted and built into resource scenarios
+        #in a pipeline, so the requests to the hobbes server, the conversion
+        #and the uploads to hydra all happen at once.
+        for resource_scenarios in self.extras_pipeline(extras_nodes, node_name_id_map):
+            for resource_scenario in resource_scenarios:
+                yield resource_scenario
 
-                extra_data = json.loads(attr_response.content)
+    def extras_pipeline(self, prmnames, node_name_id_map):
+        """
+            Generate the resource scenarios for the extras of each node, as a
+            list for each node, in the order they are finished.
+        """
+        if len(prmnames) == 0:
+            return []
 
-                non_attrs = ['prmname', 'readme']
+        if self.parse_mode == 'process':
+            return self.process_pipeline(prmnames, node_name_id_map)
 
-                for k, v in extra_data.items():
-                    if k in non_attrs:
-                        continue
-                    else:
-                        if len(v) < 2:
-                            continue
-
-                        ts = self.parse_timeseries(v)
-
-                        attr_id = self.attr_name_map[k].id
-                        dataset = dict(
-                            name = k,
-                            value = json.dumps(ts),
-                            type        = 'timeseries',
-                            dimension   = 'dimensionless',
-                            unit        = None,
-                        )
-
-                        ra_id = None
-                        for a in node_id_attr_map[node_id]:
-                            if a.attr_id == attr_id:
-                                ra_id = a.id
-                                break
-
-                        resource_scenario = dict(
-                            resource_attr_id = ra_id,
-                            attr_id          = attr_id,
-                            is_var           = 'N',
-                            value            = dataset,
-                        )
-
-                        resource_scenarios.append(resource_scenario)
-
-                
-
-        scenario['resourcescenarios'] = resource_scenarios
-        
-        new_scenario = self.connection.call('add_scenario', 
-                                               {'network_id':self.network.id,
-                                                'scen':scenario
-                                               })
+        def fetch(name):
+            return name, self.fetch_node_extras(name)
 
-        self.scenario = new_scenario
-        return new_scenario
+        def convert(fetched):
+            name, extra_data = fetched
+            return name, self.convert_extras(extra_data)
 
-    def parse_timeseries(self, timeseries_value):
+        return self.make_pipeline(fetch, convert, node_name_id_map).run(prmnames)
+
+    @contextmanager
+    def conversion_processes(self):
         """
-            Convert a hobbes timeseries to a hydra timeseries
+            Start the pool of processes which convert timeseries in 'process'
+            parse mode, to be shared by every pipeline run in this context.
+            It must be entered before any other threads are started, as
+            forking a process with threads running can deadlock.
+        """
+        if self.parse_mode != 'process' or self.process_pool is not None:
+            yield
+            return
+
+        self.process_pool = Pool(self.convert_workers)
+        try:
+            yield
+        finally:
+            self.process_pool.terminate()
+            self.process_pool.join()
+            self.process_pool = None
+
+    def process_pipeline(self, prmnames, node_name_id_map):
+        """
+            Run the extras pipeline with the JSON decoding and conversion
+            done by the pool of processes rather than threads, so they are
+            not limited to one core by the GIL.
         """
+        if self.process_pool is None:
+            raise HydraPluginError("Timeseries can only be converted in processes "
+                                   "within conversion_processes()")
 
         timeformat = config.get('DEFAULT', 'datetime_format')
+        pool = self.process_pool
 
-        val = {}
-        for timeval in timeseries_value[1:]:
-            
-            time = timeval[0]
-            split = time.split('-')
-            d = datetime(year=int(split[0]), month=int(split[1]), day=int(split[2]))
+        def fetch(name):
+            return name, self.fetch_node_extras(name, raw=True)
+
+        def convert(fetched):
+            name, body = fetched
+            return name, pool.apply(convert_extras_body,
+                                    (body, timeformat, self.timeseries_encoding))
+
+        return self.make_pipeline(fetch, convert, node_name_id_map).run(prmnames)
+
+    def make_pipeline(self, fetch, convert, node_name_id_map):
+        def build(converted):
+            name, timeseries = converted
+            return self.build_timeseries_data(timeseries, node_name_id_map[name])
+
+        return Pipeline([
+            Stage('fetch',   fetch,   self.max_connections),
+            Stage('convert', convert, self.convert_workers),
+            Stage('build',   build,   self.build_workers),
+        ])
+
+    def build_node_data(self, props, node_id):
+        """
+            Generate the resource scenarios for the repo and scalar
+            properties of a node.
+        """
+        #repo is a special case
+        repo = self.make_repo_dataset(props['repo'])
+        repo_attr_id = self.attr_name_map['repo'].id
+        ra_id = self.get_resource_attr_id('NODE', node_id, repo_attr_id)
+
+        repo_rs = dict(
+            resource_attr_id = ra_id,
+            attr_id          = repo_attr_id,
+            is_var           = 'N',
+            value            = repo,
+        )
+        yield repo_rs
+
+        for k, v in props.items():
+            if k not in NON_ATTRIBUTES:
+                if isinstance(v, float):
+                    attr_id = self.attr_name_map[k].id
+                    dataset = dict(
+                        name = k,
+                        value = str(v),
+                        type        = 'scalar',
+                        dimension   = 'dimensionless',
+                        unit        = None,
+                    )
+
+                    ra_id = self.get_resource_attr_id('NODE', node_id, attr_id)
+
+                    resource_scenario = dict(
+                        resource_attr_id = ra_id,
+                        attr_id          = attr_id,
+                        is_var           = 'N',
+                        value            = dataset,
+                    )
+
+                    yield resource_scenario
+
+    def build_extras_data(self, extra_data, node_id):
+        """
+            Make the resource scenarios for the timeseries in the
+            extras of a node.
+        """
+        return self.build_timeseries_data(self.convert_extras(extra_data), node_id)
+
+    def convert_extras(self, extra_data):
+        """
+            Convert the timeseries in the extras of a node to hydra
+            timeseries, returning a list of (name, timeseries) tuples, with
+            each timeseries serialised as JSON.
+        """
+        timeformat = config.get('DEFAULT', 'datetime_format')
 
-            tstime = datetime.strftime(d, timeformat)
-            val[tstime]  = float(timeval[1])
+        return convert_extras(extra_data, timeformat, self.timeseries_encoding)
 
-        return {"idx1": val}
+    def build_timeseries_data(self, timeseries, node_id):
+        """
+            Make the resource scenarios for the converted timeseries of a node.
+        """
+        resource_scenarios = []
+        for k, value in timeseries:
+            attr_id = self.attr_name_map[k].id
+            dataset = dict(
+                name = k,
+                value = value,
+                type        = 'timeseries',
+                dimension   = 'dimensionless',
+                unit        = None,
+            )
+            if self.timeseries_encoding != 'json':
+                #Tell readers how to decode the value
+                dataset['metadata'] = json.dumps({'encoding':self.timeseries_encoding})
+
+            ra_id = self.get_resource_attr_id('NODE', node_id, attr_id)
+
+            resource_scenario = dict(
+                resource_attr_id = ra_id,
+                attr_id          = attr_id,
+                is_var           = 'N',
+                value            = dataset,
+            )
+
+            resource_scenarios.append(resource_scenario)
+
+        return resource_scenarios
+
+    def parse_timeseries(self, timeseries_value):
+        """
+            Convert a hobbes timeseries to a hydra timeseries
+        """
+
+        timeformat = config.get('DEFAULT', 'datetime_format')
+
+        return parse_timeseries(timeseries_value, timeformat, self.timeseries_encoding)
         
 
 
@@ -477,14 +1021,307 @@ Written by Stephen Knox <stephen.knox@manchester.ac.uk>
     parser.add_argument('-c', '--session_id',
                         help='''Session ID. If this does not exist, a login will be
                         attempted based on details in config.''')
+    parser.add_argument('--hobbes-url', default=HOBBES_URL,
+                        help='''The URL of the hobbes server. Defaults to %s.'''%HOBBES_URL)
+    parser.add_argument('-w', '--max-connections', type=int, default=8,
+                        help='''The maximum number of concurrent requests made
+                        to the hobbes server when retrieving timeseries.''')
+    parser.add_argument('--timeout', type=float, default=60,
+                        help='''The number of seconds to wait for a response
+                        from the hobbes server before retrying.''')
+    parser.add_argument('--max-retries', type=int, default=5,
+                        help='''The number of times a request to the hobbes
+                        server is retried, with increasing delays, when it
+                        times out or the server is overloaded.''')
+    parser.add_argument('--max-rate', type=float, default=0,
+                        help='''The maximum number of requests per second made
+                        to the hobbes server. By default there is no limit.''')
+    parser.add_argument('--convert-workers', type=int, default=2,
+                        help='''The number of threads converting timeseries
+                        while others are fetched and uploaded.''')
+    parser.add_argument('--timeseries-encoding', choices=ENCODINGS, default='json',
+                        help='''How timeseries are sent to Hydra: 'json', as a
+                        date and value for every point, or 'compact', as a start
+                        date and frequency, or arrays of dates and values. Only
+                        use 'compact' if the data will be read by software
+                        which understands it.''')
+    parser.add_argument('--parse-mode', choices=['thread', 'process'], default='thread',
+                        help='''Whether timeseries are decoded and converted by
+                        threads, or by a pool of processes which can use more
+                        than one core.''')
+    parser.add_argument('--build-workers', type=int, default=2,
+                        help='''The number of threads building datasets from
+                        the converted timeseries.''')
+    parser.add_argument('--upload-workers', type=int, default=1,
+                        help='''The number of threads uploading batches of data
+                        to Hydra at once.''')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help='''The directory in which responses from the hobbes
+                        server are cached between runs.''')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='''Do not cache responses from the hobbes server.''')
+    parser.add_argument('-s', '--stream', action='store_true',
+                        help='''Parse the hobbes network incrementally from the
+                        response rather than loading it into memory. Requires
+                        the ijson package.''')
+    parser.add_argument('--network-id',
+                        help='''The ID of a network previously imported from hobbes.
+                        If given, only the changes since it was last imported
+                        or synced are sent to it, instead of creating a new network.''')
+    parser.add_argument('--scenario-id',
+                        help='''The scenario to update when syncing a network.
+                        Defaults to the network's 'Hobbes Import' scenario.''')
+    parser.add_argument('--watch', action='store_true',
+                        help='''Keep the network given by --network-id in sync
+                        with hobbes, polling for changes until interrupted.''')
+    parser.add_argument('--poll-interval', type=float, default=300,
+                        help='''The number of seconds between polls of the
+                        hobbes server when watching.''')
+    parser.add_argument('--watch-status',
+                        help='''A JSON file to which the lag, throughput and
+                        other counters of the watch are written after each
+                        poll.''')
+    parser.add_argument('--background-timeseries', action='store_true',
+                        help='''With -t, import the topology, scalars and
+                        repo descriptors, then return, leaving the timeseries
+                        to be backfilled by a background process.''')
+    parser.add_argument('--backfill', action='store_true',
+                        help='''Backfill the timeseries of the network and
+                        scenario given by --network-id and --scenario-id. An
+                        interrupted backfill of the same scenario is resumed.''')
+    parser.add_argument('--backfill-progress', action='store_true',
+                        help='''Report the progress of the last timeseries
+                        backfill, instead of importing.''')
+    parser.add_argument('--backfill-journal', default=DEFAULT_BACKFILL_JOURNAL,
+                        help='''The file in which the progress of the backfill
+                        is recorded, so it can be resumed.''')
+    parser.add_argument('--backfill-status', default=DEFAULT_BACKFILL_STATUS,
+                        help='''The JSON file holding the progress of the
+                        backfill, which can be read while it runs.''')
+    parser.add_argument('--journal',
+                        help='''The file in which the progress of the import is
+                        recorded, so it can be resumed if it is interrupted.
+                        Nothing is recorded if it is not given.''')
+    parser.add_argument('-r', '--resume', action='store_true',
+                        help='''Resume the interrupted import recorded in the journal,
+                        rather than starting a new one. The journal defaults to
+                        %s.'''%DEFAULT_JOURNAL)
+    parser.add_argument('-d', '--dedup', action='store_true',
+                        help='''Send each distinct dataset to Hydra only once, with
+                        every value which shares it referring to it by ID.''')
+    parser.add_argument('-b', '--batch-size', type=int, default=500,
+                        help='''The number of resource scenarios uploaded to
+                        Hydra in each request.''')
+    parser.add_argument('--shard-nodes', type=int, default=200,
+                        help='''The maximum number of nodes whose data is
+                        imported in each shard.''')
+    parser.add_argument('--shard-mb', type=float, default=50,
+                        help='''The maximum estimated size, in megabytes, of
+                        the data imported in each shard.''')
+    parser.add_argument('--shard-workers', type=int, default=2,
+                        help='''The number of shards imported at once.''')
+    parser.add_argument('--max-nodes', type=int,
+                        help='''Import the data of only the first MAX_NODES
+                        nodes, for a quick trial import. By default the data
+                        of every node is imported.''')
+    parser.add_argument('--template-cache', default=DEFAULT_TEMPLATE_CACHE,
+                        help='''The file recording the template built for each
+                        schema of the hobbes network, so a template is only
+                        uploaded when the schema changes.''')
+    parser.add_argument('--no-template-cache', action='store_true',
+                        help='''Always build and upload a new template.''')
+    parser.add_argument('--template-file',
+                        help='''A file to which the generated template is also
+                        written. By default it is only sent to Hydra.''')
+    parser.add_argument('--make-snapshot',
+                        help='''Download the hobbes network, and the extras of
+                        every node, to this snapshot file instead of importing
+                        them.''')
+    parser.add_argument('--snapshot',
+                        help='''Import from this snapshot file, made with
+                        --make-snapshot, instead of the hobbes server.''')
+    parser.add_argument('--region', action='append', dest='regions',
+                        help='''Import only the nodes in this region. Can be
+                        given more than once, to import several regions.''')
+    parser.add_argument('--upstream-of',
+                        help='''Import only the nodes upstream of this node
+                        (given by its prmname), and the node itself.''')
+    parser.add_argument('--downstream-of',
+                        help='''Import only the nodes downstream of this node
+                        (given by its prmname), and the node itself.''')
+    parser.add_argument('--source-crs', default=HOBBES_CRS,
+                        help='''The coordinate reference system of the hobbes
+                        coordinates, as EPSG:<code>. Defaults to %s
+                        (longitude and latitude).'''%HOBBES_CRS)
+    parser.add_argument('--target-crs', default=HOBBES_CRS,
+                        help='''The coordinate reference system of the hydra
+                        network, as EPSG:<code>, to which the coordinates of
+                        its nodes are reprojected. Other than EPSG:3857, this
+                        requires the pyproj package.''')
+    parser.add_argument('--metrics-file',
+                        help='''A JSON file to which the time taken, and the data
+                        transferred, by each phase of the import are written.''')
     return parser
 
+def backfill_args(args, network_id, scenario_id):
+    """
+        The command line arguments of a background backfill of the network
+        and scenario, with the same settings as this import. The session is
+        not among them, as they can be seen by other users; start_backfill
+        passes it in the environment.
+    """
+    backfill = ['--backfill',
+                '--network-id', str(network_id),
+                '--scenario-id', str(scenario_id),
+                '--backfill-journal', args.backfill_journal,
+                '--backfill-status', args.backfill_status]
+
+    for switch, value in [('-u',                    args.server_url),
+                          ('--hobbes-url',          args.hobbes_url),
+                          ('-w',                    args.max_connections),
+                          ('--timeout',             args.timeout),
+                          ('--max-retries',         args.max_retries),
+                          ('--max-rate',            args.max_rate),
+                          ('--convert-workers',     args.convert_workers),
+                          ('--parse-mode',          args.parse_mode),
+                          ('--build-workers',       args.build_workers),
+                          ('--upload-workers',      args.upload_workers),
+                          ('--timeseries-encoding', args.timeseries_encoding),
+                          ('--cache-dir',           args.cache_dir),
+                          ('--snapshot',            args.snapshot),
+                          ('-b',                    args.batch_size),
+                          ('--max-nodes',           args.max_nodes)]:
+        if value is not None:
+            backfill.extend([switch, str(value)])
+
+    for switch, value in [('--no-cache', args.no_cache),
+                          ('-d',         args.dedup),
+                          ('-s',         args.stream)]:
+        if value is True:
+            backfill.append(switch)
+
+    return backfill
+
+def report_backfill_progress(args):
+    """
+        Report the progress of the last timeseries backfill in the response
+        of the plugin.
+    """
+    status = read_status(args.backfill_status)
+    network_id, scenario_ids = None, []
+    if status is not None:
+        network_id, scenario_ids = status['network_id'], [status['scenario_id']]
+
+    errors = []
+    if status is not None and status['state'] == 'failed':
+        errors = [status['error']]
+
+    message = describe_status(status)
+    write_output(message)
+    print PluginLib.create_xml_response('Import Hobbes', network_id, scenario_ids, errors,
+                                        [], message, [])
+
+def take_snapshot(args, cache, scheduler):
+    """
+        Download the hobbes network into a snapshot. Only the hobbes server
+        is needed, so no connection is made to hydra.
+    """
+    client = HobbesClient(url=args.hobbes_url,
+                          max_connections=args.max_connections,
+                          cache=cache,
+                          scheduler=scheduler)
+    metrics = ImportMetrics(client, None)
+
+    errors = []
+    try:
+        validate_plugin_xml(os.path.join(__location__, 'plugin.xml'))
+        with metrics.phase('snapshot'):
+            make_snapshot(client, args.make_snapshot, args.max_connections)
+        message = "Snapshot complete"
+    except HydraPluginError as e:
+        message="An error has occurred"
+        errors = [e.message]
+        log.exception(e)
+    except Exception, e:
+        message="An unknown error has occurred"
+        log.exception(e)
+        errors = [e]
+
+    xml_response = PluginLib.create_xml_response('Import Hobbes', None, [], errors,
+                                                 [], message, [])
+    xml_response = metrics.add_to_response(xml_response)
+    if args.metrics_file is not None:
+        metrics.write(args.metrics_file)
+    print xml_response
 
 def run():
 
     parser = commandline_parser()
     args = parser.parse_args()
-    hobbes_importer = HobbesImporter(url=args.server_url, session_id=args.session_id)
+
+    if args.backfill_progress is True:
+        report_backfill_progress(args)
+        return
+
+    #The journal is only written when asked for, as it costs a sync to disk
+    #for every batch.
+    journal_path = args.journal
+    if args.resume is True and journal_path is None:
+        journal_path = DEFAULT_JOURNAL
+    session_id = args.session_id
+    if args.backfill is True:
+        journal_path = args.backfill_journal
+        if session_id is None:
+            session_id = os.environ.get(SESSION_ENV)
+
+    cache = None
+    if args.no_cache is False:
+        cache = HobbesCache(args.cache_dir)
+
+    scheduler = RequestScheduler(max_connections=args.max_connections,
+                                 max_rate=args.max_rate,
+                                 timeout=args.timeout,
+                                 max_retries=args.max_retries)
+
+    if args.make_snapshot is not None:
+        take_snapshot(args, cache, scheduler)
+        return
+
+    subset = NetworkSubset(regions=args.regions,
+                           upstream_of=args.upstream_of,
+                           downstream_of=args.downstream_of)
+    if subset.is_empty():
+        subset = None
+
+    journal = None
+    if journal_path is not None:
+        journal = ImportJournal(journal_path)
+
+    hobbes_importer = HobbesImporter(url=args.server_url,
+                                     session_id=session_id,
+                                     max_connections=args.max_connections,
+                                     cache=cache,
+                                     stream=args.stream,
+                                     batch_size=args.batch_size,
+                                     journal=journal,
+                                     dedup=args.dedup,
+                                     hobbes_url=args.hobbes_url,
+                                     count_hydra_bytes=args.metrics_file is not None,
+                                     subset=subset,
+                                     snapshot=args.snapshot,
+                                     scheduler=scheduler,
+                                     convert_workers=args.convert_workers,
+                                     build_workers=args.build_workers,
+                                     upload_workers=args.upload_workers,
+                                     parse_mode=args.parse_mode,
+                                     timeseries_encoding=args.timeseries_encoding,
+                                     shard_nodes=args.shard_nodes,
+                                     shard_mb=args.shard_mb,
+                                     shard_workers=args.shard_workers,
+                                     max_nodes=args.max_nodes,
+                                     source_crs=args.source_crs,
+                                     target_crs=args.target_crs)
+    metrics = hobbes_importer.metrics
 
     scenarios = []
     errors = []
@@ -495,24 +1332,104 @@ def run():
         
         validate_plugin_xml(os.path.join(__location__, 'plugin.xml'))
 
-        #This step is to avoid doing the request to make the template and 
-        #then again for the data.
-        hobbes_importer.fetch_remote_network()
-        if args.template_id is None:
-            tmpl = HobbesTemplateBuilder()
-            tmpl.convert(hobbes_importer.json_net)
-            hobbes_importer.upload_template()
+        if args.watch is False:
+            #This step is to avoid doing the request to make the template and 
+            #then again for the data.
+            with metrics.phase('fetch_network'):
+                hobbes_importer.fetch_remote_network()
+
+        if args.watch is True:
+            if args.network_id is None:
+                raise HydraPluginError("A network to keep in sync must be given with --network-id")
+            if args.template_id is not None:
+                hobbes_importer.fetch_template(args.template_id)
+
+            watcher = HobbesWatcher(hobbes_importer,
+                                    args.network_id,
+                                    args.scenario_id,
+                                    args.include_timeseries,
+                                    interval=args.poll_interval,
+                                    status_file=args.watch_status)
+            with metrics.phase('watch'):
+                stats = watcher.run()
+            #Set by the last successful sync, if any
+            net = getattr(hobbes_importer, 'network', None)
+            scenario = getattr(hobbes_importer, 'scenario', None)
+            message = "Watch stopped after %s polls and %s syncs"%(stats.polls, stats.syncs)
+        elif args.backfill is True:
+            if args.network_id is None or args.scenario_id is None:
+                raise HydraPluginError("A backfill needs --network-id and --scenario-id")
+
+            backfill = HobbesBackfill(hobbes_importer, BackfillStatus(args.backfill_status))
+            with metrics.phase('backfill'):
+                backfill.run(args.network_id, args.scenario_id)
+            net, scenario = hobbes_importer.network, hobbes_importer.scenario
+            message = "Timeseries backfill complete"
+        elif args.resume is True:
+            with metrics.phase('resume'):
+                scenario = hobbes_importer.resume()
+                net = hobbes_importer.network
+            with metrics.phase('data'):
+                scenario = hobbes_importer.import_data(include_timeseries=args.include_timeseries,
+                                                       new_scenario=scenario)
+            message = "Import complete"
+        elif args.network_id is not None:
+            #Update an existing network rather than creating a new one.
+            with metrics.phase('template'):
+                if args.template_id is not None:
+                    hobbes_importer.fetch_template(args.template_id)
+
+            with metrics.phase('sync'):
+                hobbes_sync = HobbesSync(hobbes_importer)
+                net, scenario = hobbes_sync.sync(args.network_id,
+                                                 args.scenario_id,
+                                                 args.include_timeseries)
+            message = "Sync complete"
         else:
-            hobbes_importer.fetch_template(args.template_id)
-        
-        net = hobbes_importer.import_network_topology(args.project_id)
-
-        scenario = hobbes_importer.import_data()
+            with metrics.phase('template'):
+                if args.template_id is None:
+                    template_cache = None
+                    if args.no_template_cache is False:
+                        template_cache = TemplateCache(args.template_cache)
+                    hobbes_importer.build_template(template_cache,
+                                                   args.template_file)
+                else:
+                    hobbes_importer.fetch_template(args.template_id)
+            
+            with metrics.phase('topology'):
+                net = hobbes_importer.import_network_topology(args.project_id)
+
+            #With --background-timeseries, the timeseries requested with -t
+            #are left to the backfill.
+            background = args.include_timeseries is True and args.background_timeseries is True
+            with metrics.phase('data'):
+                scenario = hobbes_importer.import_data(
+                    include_timeseries=args.include_timeseries is True and background is False)
+
+            message = "Import complete"
+
+            if background is True:
+                #The network can be used now. Its timeseries follow.
+                try:
+                    start_backfill(os.path.abspath(sys.argv[0]),
+                                   backfill_args(args, net.id, scenario.id),
+                                   os.path.splitext(args.backfill_status)[0] + '.log',
+                                   session_id=hobbes_importer.connection.session_id)
+                except Exception as e:
+                    #The import itself has been committed, so it is reported
+                    #as a success.
+                    log.exception(e)
+                    hobbes_importer.warnings.append("Backfill not started: %s"%e)
+                    message = "Import succeeded; backfill not started. " \
+                              "Run with --backfill to upload the timeseries."
+                else:
+                    message = "Import complete. Timeseries are being backfilled in the background; " \
+                              "use --backfill-progress to follow them."
 
         #scenarios = [s.id for s in net.scenarios]
-        network_id = net.id
-        scenario_id = scenario.id
-        message = "Import complete"
+        if net is not None:
+            network_id = net.id
+            scenario_id = scenario.id
     except HydraPluginError as e:
         message="An error has occurred"
         errors = [e.message]
@@ -522,6 +1439,18 @@ def run():
         log.exception(e)
         errors = [e]
 
+    if network_id is None:
+        #A failed import still reports the network it created, which can be
+        #resumed, if the import was journalled, or removed.
+        net = getattr(hobbes_importer, 'network', None)
+        if net is not None:
+            network_id = net.id
+            if journal is not None and journal.network_id == net.id:
+                scenario_id = journal.scenario_id
+                hobbes_importer.warnings.append(
+                    "The import into network %s can be resumed with --resume --journal %s"
+                    % (net.id, journal_path))
+
     xml_response = PluginLib.create_xml_response('Import Hobbes',
                                                  network_id,
                                                  [scenario_id],
@@ -529,6 +1458,9 @@ def run():
                                                  hobbes_importer.warnings,
                                                  message,
                                                  hobbes_importer.files)
+    xml_response = metrics.add_to_response(xml_response)
+    if args.metrics_file is not None:
+        metrics.write(args.metrics_file)
     print xml_response
 
 if __name__ == '__main__':
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# hobbes_journal is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# hobbes_journal is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with hobbes_journal.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+A checkpoint journal, so an interrupted import can be resumed.
+"""
+
+import logging
+
+import json
+
+import os
+
+from threading import Lock
+
+from HydraLib.HydraException import HydraPluginError
+
+log = logging.getLogger(__name__)
+
+DEFAULT_JOURNAL = os.path.join(os.path.expanduser('~'), '.hobbes_import.journal')
+
+class ImportJournal(object):
+    """
+        An append-only record of the progress of an import: the network and
+        scenario being imported into, the nodes whose extras have been fetched
+        and the resource attributes whose data hydra has accepted.
+
+        Each record is one line of JSON, synced to disk before the import
+        continues, so the journal survives the import being killed.
+    """
+    def __init__(self, path=DEFAULT_JOURNAL):
+        self.path = path
+        self.lock = Lock()
+        self.journal_file = None
+
+        self.network_id  = None
+        self.scenario_id = None
+        self.template_id = None
+        self.complete    = False
+        self.fetched  = set()
+        self.uploaded = set()
+
+    def _write(self, record):
+        if self.journal_file is None:
+            return
+        with self.lock:
+            self.journal_file.write(json.dumps(record) + '\n')
+            self.journal_file.flush()
+            os.fsync(self.journal_file.fileno())
+
+    def start(self, network_id, scenario_id, template_id):
+        """
+            Begin a new journal, replacing any previous one.
+        """
+        self.close()
+        self.journal_file = open(self.path, 'w')
+
+        self.network_id  = network_id
+        self.scenario_id = scenario_id
+        self.template_id = template_id
+        self.complete    = False
+        self.fetched  = set()
+        self.uploaded = set()
+
+        self._write({'event'      : 'start',
+                     'network_id' : network_id,
+                     'scenario_id': scenario_id,
+                     'template_id': template_id})
+
+    def load(self):
+        """
+            Read the journal of a previous import, so it can be resumed.
+        """
+        if not os.path.exists(self.path):
+            raise HydraPluginError("No import to resume: %s not found."%self.path)
+
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    #The last record may have been cut short.
+                    log.warn("Ignoring incomplete record in %s", self.path)
+                    break
+
+                event = record['event']
+                if event == 'start':
+                    self.network_id  = record['network_id']
+                    self.scenario_id = record['scenario_id']
+                    self.template_id = record['template_id']
+                elif event == 'extras':
+                    self.fetched.add(record['prmname'])
+                elif event == 'batch':
+                    self.uploaded.update(record['resource_attr_ids'])
+                elif event == 'complete':
+                    self.complete = True
+
+        if self.network_id is None:
+            raise HydraPluginError("No import to resume: %s is empty."%self.path)
+
+        if self.complete is True:
+            raise HydraPluginError("The import in %s has already completed."%self.path)
+
+        log.info("Resuming import into network %s. %s extras fetched, %s values uploaded.",
+                 self.network_id, len(self.fetched), len(self.uploaded))
+
+        self.journal_file = open(self.path, 'a')
+
+    def record_extras(self, prmname):
+        self.fetched.add(prmname)
+        self._write({'event':'extras', 'prmname':prmname})
+
+    def record_batch(self, batch):
+        """
+            Record that hydra has accepted a batch of resource scenarios.
+        """
+        resource_attr_ids = [rs['resource_attr_id'] for rs in batch]
+        self.uploaded.update(resource_attr_ids)
+        self._write({'event':'batch', 'resource_attr_ids':resource_attr_ids})
+
+    def finish(self):
+        self._write({'event':'complete'})
+        self.close()
+
+    def close(self):
+        if self.journal_file is not None:
+            self.journal_file.close()
+            self.journal_file = None
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# hobbes_metrics is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# hobbes_metrics is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with hobbes_metrics.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+Per-phase timing and I/O metrics for an import.
+"""
+
+import logging
+
+import json
+
+import os, sys
+
+import time
+
+from contextlib import contextmanager
+
+from threading import Lock
+
+from lxml import etree
+
+try:
+    import resource
+except ImportError:
+    #Not available on Windows
+    resource = None
+
+log = logging.getLogger(__name__)
+
+def cpu_time():
+    t = os.times()
+    return t[0] + t[1]
+
+def peak_memory():
+    """
+        The peak memory use of the process so far, in bytes, or None where
+        this cannot be measured.
+    """
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #ru_maxrss is in bytes on OS X and kilobytes elsewhere.
+    if sys.platform == 'darwin':
+        return maxrss
+    return maxrss * 1024
+
+class MeteredConnection(object):
+    """
+        Wraps a connection to hydra, counting the calls made through it and,
+        if count_bytes is set, the size of their requests. Counting bytes
+        means serialising each request a second time, so it is optional.
+    """
+    def __init__(self, connection, count_bytes=False):
+        self.connection  = connection
+        self.count_bytes = count_bytes
+
+        self.lock = Lock()
+        self.num_calls  = 0
+        self.bytes_sent = 0
+
+    def call(self, func, args):
+        with self.lock:
+            self.num_calls += 1
+        if self.count_bytes is True:
+            size = len(json.dumps(args, default=list))
+            with self.lock:
+                self.bytes_sent += size
+        return self.connection.call(func, args)
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+class ImportMetrics(object):
+    """
+        Records, for each phase of an import, its wall and CPU time, the
+        number of requests to hobbes and calls to hydra, the bytes
+        transferred and the time spent parsing JSON.
+
+        Only the peak memory of the whole process is available, so each
+        phase records that peak as it stood at the end of the phase
+        (process_peak_memory), and how much the phase raised it
+        (peak_memory_growth). A phase with no growth stayed within the
+        peak of an earlier phase.
+    """
+    def __init__(self, client, connection):
+        self.client     = client
+        self.connection = connection
+        self.phases = []
+
+    def counters(self):
+        return dict(
+            wall           = time.time(),
+            cpu            = cpu_time(),
+            http_requests  = self.client.num_requests,
+            http_bytes     = self.client.bytes_received,
+            parse_time     = self.client.parse_time,
+            hydra_calls    = getattr(self.connection, 'num_calls', 0),
+            hydra_bytes    = getattr(self.connection, 'bytes_sent', 0),
+        )
+
+    @contextmanager
+    def phase(self, name):
+        before = self.counters()
+        peak_before = peak_memory()
+        try:
+            yield
+        finally:
+            after = self.counters()
+            record = dict((k, after[k] - before[k]) for k in after)
+            record['name'] = name
+            record['process_peak_memory'] = peak_memory()
+            record['peak_memory_growth'] = None
+            if peak_before is not None:
+                record['peak_memory_growth'] = record['process_peak_memory'] - peak_before
+            self.phases.append(record)
+            log.info(self.describe(record))
+
+    def total(self):
+        total = dict(name='total')
+        for k in ('wall', 'cpu', 'http_requests', 'http_bytes', 'parse_time',
+                  'hydra_calls', 'hydra_bytes'):
+            total[k] = sum(p[k] for p in self.phases)
+        total['process_peak_memory'] = peak_memory()
+        total['peak_memory_growth'] = None
+        return total
+
+    def describe(self, record):
+        text = "%s: %.2fs wall, %.2fs cpu (%.2fs parsing JSON), %s hobbes requests (%s bytes), %s hydra calls" % \
+            (record['name'], record['wall'], record['cpu'], record['parse_time'],
+             record['http_requests'], record['http_bytes'], record['hydra_calls'])
+        if record['hydra_bytes'] > 0:
+            text += " (%s bytes)"%record['hydra_bytes']
+        if record['process_peak_memory'] is not None:
+            text += ", process peak memory so far %.1f MB" % \
+                (record['process_peak_memory'] / (1024.0 * 1024.0))
+        if record['peak_memory_growth'] is not None:
+            text += " (+%.1f MB in this phase)"%(record['peak_memory_growth'] / (1024.0 * 1024.0))
+        return text
+
+    def write(self, path):
+        """
+            Write the metrics of every phase, and their total, to a JSON file.
+        """
+        with open(path, 'w') as f:
+            json.dump({'phases':self.phases, 'total':self.total()}, f, indent=2)
+
+    def add_to_response(self, xml_response):
+        """
+            Add a 'metrics' element, with an entry for each phase, to the
+            XML response of the plugin.
+        """
+        try:
+            tree = etree.fromstring(xml_response)
+        except etree.XMLSyntaxError:
+            log.warn("Unable to add metrics to the plugin response.")
+            return xml_response
+
+        metrics = etree.SubElement(tree, 'metrics')
+        for record in self.phases + [self.total()]:
+            phase = etree.SubElement(metrics, 'phase')
+            for k in sorted(record):
+                value = etree.SubElement(phase, k)
+                value.text = str(record[k]) if record[k] is not None else ''
+
+        return etree.tostring(tree, pretty_print=True)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# hobbes_pipeline is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# hobbes_pipeline is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with hobbes_pipeline.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+A pipeline of stages, each run by its own pool of threads and connected to
+the next by a bounded queue, so that all the stages work at once. Items
+leave the pipeline in the order they are finished, not the order they
+entered it.
+"""
+
+import logging
+
+import sys
+
+from threading import Thread, Lock, Event
+
+from Queue import Queue, Full, Empty
+
+log = logging.getLogger(__name__)
+
+#Marks the end of the items in a queue
+_DONE = object()
+
+class _Failure(object):
+    """
+        An exception raised by a stage, passed along the pipeline so it is
+        raised where the results are read.
+    """
+    def __init__(self, exc_info):
+        self.exc_info = exc_info
+
+class Stage(object):
+    """
+        A step of a pipeline: a function applied to each item by 'workers'
+        threads.
+    """
+    def __init__(self, name, func, workers=1):
+        self.name    = name
+        self.func    = func
+        self.workers = max(1, workers)
+
+class Pipeline(object):
+    """
+        Runs items through a sequence of stages. At most queue_size items
+        wait between any two stages, so a fast stage cannot run far ahead
+        of a slow one.
+    """
+    def __init__(self, stages, queue_size=4):
+        self.stages = stages
+        self.queue_size = queue_size
+
+        self.stopped = None
+
+    def _put(self, queue, item):
+        while not self.stopped.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return
+            except Full:
+                pass
+
+    def _get(self, queue):
+        while not self.stopped.is_set():
+            try:
+                return queue.get(timeout=0.1)
+            except Empty:
+                pass
+        return _DONE
+
+    def _feed(self, items, queue, num_workers):
+        try:
+            for item in items:
+                if self.stopped.is_set():
+                    return
+                self._put(queue, item)
+        except:
+            self._put(queue, _Failure(sys.exc_info()))
+        for i in range(num_workers):
+            self._put(queue, _DONE)
+
+    def _work(self, stage, in_queue, out_queue, remaining, lock, num_next):
+        while True:
+            item = self._get(in_queue)
+            if item is _DONE:
+                break
+
+            if not isinstance(item, _Failure):
+                try:
+                    item = stage.func(item)
+                except:
+                    item = _Failure(sys.exc_info())
+
+            self._put(out_queue, item)
+
+        #The last worker of the stage to finish tells the next stage.
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            for i in range(num_next):
+                self._put(out_queue, _DONE)
+
+    def run(self, items):
+        """
+            Generate the results of the last stage for each of the items.
+            If any stage raises an exception, it is raised here and the
+            pipeline is stopped.
+        """
+        self.stopped = Event()
+
+        queues = [Queue(maxsize=self.queue_size) for s in self.stages]
+        queues.append(Queue(maxsize=self.queue_size))
+
+        threads = [Thread(target=self._feed,
+                          args=(items, queues[0], self.stages[0].workers))]
+        for i, stage in enumerate(self.stages):
+            if i + 1 < len(self.stages):
+                num_next = self.stages[i + 1].workers
+            else:
+                num_next = 1
+            remaining = [stage.workers]
+            lock = Lock()
+            for w in range(stage.workers):
+                threads.append(Thread(target=self._work,
+                                      name="%s-%s"%(stage.name, w),
+                                      args=(stage, queues[i], queues[i + 1],
+                                            remaining, lock, num_next)))
+
+        for t in threads:
+            t.daemon = True
+            t.start()
+
+        try:
+            while True:
+                result = self._get(queues[-1])
+                if result is _DONE:
+                    break
+                if isinstance(result, _Failure):
+                    raise result.exc_info[0], result.exc_info[1], result.exc_info[2]
+                yield result
+        finally:
+            self.stopped.set()
+            for t in threads:
+                t.join()
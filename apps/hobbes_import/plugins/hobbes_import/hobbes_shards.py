@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# hobbes_shards is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# hobbes_shards is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with hobbes_shards.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+Planning of the data import into shards: groups of nodes whose data is
+imported together, so several shards can be imported at once.
+
+The size of a node's data is not known until its extras are fetched, so it
+is estimated from the number of scalar values and timeseries it has. A shard
+holds only the prmnames of its nodes, not their features, so planning does
+not keep the network in memory when it is streamed.
+"""
+
+import logging
+
+from hobbes_sync import has_extras
+from create_hobbes_template import NON_ATTRIBUTES
+
+log = logging.getLogger(__name__)
+
+#Estimated bytes sent to hydra for each scalar value and each timeseries.
+#A hobbes timeseries is typically a monthly or daily series over decades.
+SCALAR_BYTES = 300
+TIMESERIES_BYTES = 100 * 1024
+
+def estimate_size(props, include_timeseries=True):
+    """
+        The estimated number of bytes of data a node sends to hydra.
+    """
+    num_scalars = len([k for k in props if k not in NON_ATTRIBUTES])
+    size = num_scalars * SCALAR_BYTES
+    if include_timeseries is True and has_extras(props):
+        size += len(props['extras']) * TIMESERIES_BYTES
+    return size
+
+def node_sizes(features, include_timeseries=True):
+    """
+        Generate the prmname and estimated data size of each feature.
+    """
+    for feature in features:
+        props = feature['properties']
+        yield props['prmname'], estimate_size(props, include_timeseries)
+
+class Shard(object):
+    """
+        The prmnames of a group of nodes, and the estimated size of their data.
+    """
+    def __init__(self, index):
+        self.index    = index
+        self.prmnames = []
+        self.size     = 0
+
+    def add(self, prmname, size):
+        self.prmnames.append(prmname)
+        self.size += size
+
+    def __len__(self):
+        return len(self.prmnames)
+
+def plan_shards(nodes, max_nodes=200, max_size=50 * 1024 * 1024):
+    """
+        Divide nodes, given as (prmname, estimated size) tuples, into shards
+        of at most max_nodes nodes and (unless a single node is larger)
+        max_size estimated bytes, keeping the order of the network.
+    """
+    shards = []
+    shard  = None
+    for prmname, size in nodes:
+        if shard is None or len(shard) >= max_nodes or \
+                (len(shard) > 0 and shard.size + size > max_size):
+            shard = Shard(len(shards))
+            shards.append(shard)
+        shard.add(prmname, size)
+
+    log.info("Planned %s shards of %s nodes, %.1f MB estimated",
+             len(shards), sum(len(s) for s in shards),
+             sum(s.size for s in shards) / (1024.0 * 1024.0))
+
+    return shards
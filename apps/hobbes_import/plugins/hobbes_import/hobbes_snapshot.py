@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# hobbes_snapshot is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# hobbes_snapshot is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with hobbes_snapshot.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+Snapshots of the hobbes network, for imports without access to the hobbes
+server.
+
+A snapshot is a SQLite database holding the compressed network/get response
+and the compressed network/extras response of every node with extras, keyed
+by prmname, so the extras of any node can be read without reading the rest.
+"""
+
+import logging
+
+import os
+
+import sqlite3
+
+import zlib
+
+from datetime import datetime
+
+from multiprocessing.pool import ThreadPool
+
+from StringIO import StringIO
+
+from threading import Lock
+
+from urlparse import urlparse
+
+from HydraLib.PluginLib import write_output
+from HydraLib.HydraException import HydraPluginError
+
+from hobbes_client import HobbesClient
+
+log = logging.getLogger(__name__)
+
+#Bytes of the snapshot SQLite may memory map, rather than read
+MMAP_SIZE = 1024 * 1024 * 1024
+
+SCHEMA = """
+    CREATE TABLE meta    (key TEXT PRIMARY KEY, value TEXT);
+    CREATE TABLE network (id INTEGER PRIMARY KEY, body BLOB);
+    CREATE TABLE extras  (prmname TEXT PRIMARY KEY, body BLOB);
+"""
+
+def make_snapshot(client, path, max_connections=8):
+    """
+        Download the hobbes network, and the extras of every node which has
+        any, into a new snapshot. The snapshot is written to a temporary
+        file first, so an interrupted download leaves no partial snapshot.
+    """
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    db = sqlite3.connect(tmp_path)
+    try:
+        db.executescript(SCHEMA)
+
+        network = client.get("network/get")
+        db.execute("INSERT INTO network VALUES (1, ?)",
+                   (sqlite3.Binary(zlib.compress(network)),))
+
+        prmnames = [f['properties']['prmname'] for f in client.parse(network)
+                    if f['properties'].get('extras')]
+        write_output("Downloading the extras of %s nodes"%len(prmnames))
+
+        def fetch(prmname):
+            return prmname, client.get("network/extras?prmname=%s"%prmname)
+
+        pool = ThreadPool(max_connections)
+        try:
+            for prmname, extras in pool.imap_unordered(fetch, prmnames):
+                db.execute("INSERT INTO extras VALUES (?, ?)",
+                           (prmname, sqlite3.Binary(zlib.compress(extras))))
+        finally:
+            pool.close()
+            pool.join()
+
+        db.executemany("INSERT INTO meta VALUES (?, ?)",
+                       [('hobbes_url', client.url),
+                        ('created', datetime.now().isoformat())])
+        db.commit()
+    finally:
+        db.close()
+
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(tmp_path, path)
+
+    log.info("Snapshot of %s nodes written to %s", len(prmnames), path)
+
+def query_value(query, name):
+    """
+        The value of a parameter in a query string, exactly as it appears
+        there. It is not unquoted, as the prmname of a node is put into the
+        request path as it is, and may contain '+'.
+    """
+    for param in query.split('&'):
+        key, _, value = param.partition('=')
+        if key == name:
+            return value
+    return None
+
+class SnapshotClient(HobbesClient):
+    """
+        Reads the hobbes network and extras from a snapshot instead of the
+        hobbes server. Responses are read by key, using memory-mapped I/O,
+        so looking up the extras of a node does not depend on the size of
+        the snapshot.
+    """
+    def __init__(self, path):
+
+        if not os.path.exists(path):
+            raise HydraPluginError("Snapshot %s not found"%path)
+
+        self.path  = path
+        self.cache = None
+
+        #Extras are read from several threads at once.
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA mmap_size=%s"%MMAP_SIZE)
+        self.db_lock = Lock()
+
+        self.url = self.read_meta('hobbes_url')
+        write_output("Using snapshot of %s taken at %s"%(self.url, self.read_meta('created')))
+
+        self.lock = Lock()
+        self.num_requests   = 0
+        self.bytes_received = 0
+        self.parse_time     = 0.0
+
+    def read_meta(self, key):
+        with self.db_lock:
+            row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def open(self, path, revalidate=True):
+        """
+            Read the response to a request from the snapshot, as a file-like
+            object.
+        """
+        url = urlparse(path)
+        if url.path == 'network/get':
+            query, key = "SELECT body FROM network WHERE id = ?", 1
+        elif url.path == 'network/extras':
+            key = query_value(url.query, 'prmname')
+            query = "SELECT body FROM extras WHERE prmname = ?"
+        else:
+            raise HydraPluginError("%s is not in the snapshot"%path)
+
+        with self.db_lock:
+            row = self.db.execute(query, (key,)).fetchone()
+        if row is None:
+            raise HydraPluginError("%s is not in the snapshot"%path)
+
+        self._count(num_requests=1, bytes_received=len(row[0]))
+        return StringIO(zlib.decompress(row[0]))
+
+    def close(self):
+        self.db.close()
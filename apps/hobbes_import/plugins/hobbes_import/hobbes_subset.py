@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# hobbes_subset is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# hobbes_subset is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with hobbes_subset.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+Selection of part of the hobbes network to import: the nodes in some
+regions, or the catchment upstream or downstream of a node.
+"""
+
+import logging
+
+from collections import OrderedDict
+
+from HydraLib.HydraException import HydraPluginError
+
+log = logging.getLogger(__name__)
+
+class NetworkAdjacency(object):
+    """
+        The nodes immediately upstream and downstream of each node, found
+        by matching the origins (links in) and terminals (links out) of the
+        hobbes nodes.
+    """
+    def __init__(self):
+        self.upstream   = {}
+        self.downstream = {}
+
+        self.link_from = {}
+        self.link_to   = {}
+
+    def add(self, props):
+        name = props['prmname']
+        self.upstream.setdefault(name, set())
+        self.downstream.setdefault(name, set())
+
+        for o in props.get('origins', []):
+            self.link_to[o['link_prmname']] = name
+            self.connect(o['link_prmname'])
+
+        for t in props.get('terminals', []):
+            self.link_from[t['link_prmname']] = name
+            self.connect(t['link_prmname'])
+
+    def connect(self, linkname):
+        node_1 = self.link_from.get(linkname)
+        node_2 = self.link_to.get(linkname)
+        if node_1 is not None and node_2 is not None:
+            self.downstream[node_1].add(node_2)
+            self.upstream[node_2].add(node_1)
+
+    def traverse(self, start, neighbours):
+        """
+            All the nodes reachable from start (including start itself)
+            through the given neighbours.
+        """
+        if start not in neighbours:
+            raise HydraPluginError("Node %s is not in the hobbes network"%start)
+
+        reached = set([start])
+        to_visit = [start]
+        while len(to_visit) > 0:
+            for name in neighbours[to_visit.pop()]:
+                if name not in reached:
+                    reached.add(name)
+                    to_visit.append(name)
+        return reached
+
+    def upstream_of(self, name):
+        return self.traverse(name, self.upstream)
+
+    def downstream_of(self, name):
+        return self.traverse(name, self.downstream)
+
+class NetworkSubset(object):
+    """
+        The nodes to import: those in any of the given regions, upstream of
+        a node or downstream of a node. When more than one of these is given,
+        only the nodes which satisfy all of them are imported.
+
+        Each region and catchment becomes a group in hydra, holding the
+        imported nodes which belong to it.
+    """
+    def __init__(self, regions=None, upstream_of=None, downstream_of=None):
+        self.regions       = regions or []
+        self.upstream_of   = upstream_of
+        self.downstream_of = downstream_of
+
+        #The selected nodes of each group, by group name
+        self.members = OrderedDict()
+        self.descriptions = {}
+
+    def is_empty(self):
+        return len(self.regions) == 0 and self.upstream_of is None and self.downstream_of is None
+
+    def select(self, features):
+        """
+            Find the names of the nodes to import.
+        """
+        adjacency = NetworkAdjacency()
+        region_nodes = OrderedDict((r, set()) for r in self.regions)
+
+        for feature in features:
+            props = feature['properties']
+            adjacency.add(props)
+            for region in props.get('regions', []):
+                if region in region_nodes:
+                    region_nodes[region].add(props['prmname'])
+
+        groups = []
+        for region, nodes in region_nodes.items():
+            groups.append((region, "Nodes in the %s region"%region, nodes))
+
+        selected = set(adjacency.upstream)
+        if len(region_nodes) > 0:
+            selected &= set.union(*region_nodes.values())
+
+        if self.upstream_of is not None:
+            catchment = adjacency.upstream_of(self.upstream_of)
+            groups.append(("Upstream of %s"%self.upstream_of,
+                           "Nodes upstream of %s"%self.upstream_of,
+                           catchment))
+            selected &= catchment
+
+        if self.downstream_of is not None:
+            catchment = adjacency.downstream_of(self.downstream_of)
+            groups.append(("Downstream of %s"%self.downstream_of,
+                           "Nodes downstream of %s"%self.downstream_of,
+                           catchment))
+            selected &= catchment
+
+        for name, description, nodes in groups:
+            self.members[name] = nodes & selected
+            self.descriptions[name] = description
+
+        log.info("Selected %s of %s nodes", len(selected), len(adjacency.upstream))
+
+        return selected
@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# hobbes_sync is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# hobbes_sync is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with hobbes_sync.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+Incremental update of a hydra network previously imported from hobbes.
+
+Every imported node records a hash of its hobbes feature (and of its extras,
+once they have been synced) in its layout. Comparing these with the hashes
+of the current hobbes network identifies the nodes which have been added,
+removed or changed, so only those are sent to hydra.
+
+The layout also records the attributes the node had values for, so the data
+of a property which has been removed from a hobbes node is removed from
+hydra too.
+"""
+
+import logging
+
+import json
+
+import hashlib
+
+from collections import OrderedDict
+
+from multiprocessing.pool import ThreadPool
+
+from HydraLib.PluginLib import write_output, RequestError
+from HydraLib.HydraException import HydraPluginError
+
+from create_hobbes_template import NON_ATTRIBUTES
+
+log = logging.getLogger(__name__)
+
+def content_hash(value):
+    """
+        A hash of a JSON value which does not depend on the order of its keys.
+    """
+    return hashlib.sha1(json.dumps(value, sort_keys=True)).hexdigest()
+
+def has_extras(props):
+    extras = props.get('extras')
+    return extras is not None and len(extras) > 0
+
+def data_attributes(props):
+    """
+        The names of the attributes a hobbes node has values for: its repo,
+        its scalar properties and its timeseries.
+    """
+    names = [k for k, v in props.items() if k not in NON_ATTRIBUTES and isinstance(v, float)]
+    if 'repo' in props:
+        names.append('repo')
+    if has_extras(props):
+        names.extend(props['extras'])
+    return sorted(names)
+
+def get_layout(resource):
+    """
+        The layout of a hydra resource as a dict. Depending on the server,
+        this may be returned as a JSON string.
+    """
+    layout = getattr(resource, 'layout', None)
+    if layout is None:
+        return {}
+    if isinstance(layout, basestring):
+        return json.loads(layout) if layout else {}
+    return dict(layout)
+
+class HobbesSync(object):
+    """
+        Brings an existing hydra network up to date with the hobbes network,
+        sending only the nodes, links and data which have changed.
+    """
+    def __init__(self, importer):
+        self.importer   = importer
+        self.connection = importer.connection
+
+        self.added   = []
+        self.changed = []
+        self.removed = []
+        self.extras_changed = []
+        self.data_removed = 0
+
+    def fetch_network(self, network_id):
+        """
+            Get the network, and the template it was imported with.
+        """
+        network = self.connection.call('get_network', {'network_id':int(network_id),
+                                                       'include_data':'N'})
+
+        if self.importer.template is None:
+            self.importer.fetch_template(network.types[0].template_id)
+
+        return network
+
+    def fetch_scenario(self, network, scenario_id=None):
+        """
+            Find the scenario to update: the one specified, or else the
+            network's 'Hobbes Import' scenario, creating it if necessary.
+        """
+        if scenario_id is not None:
+            for s in network.scenarios:
+                if s.id == int(scenario_id):
+                    return s
+            raise HydraPluginError("Scenario %s not found in network %s"
+                                   % (scenario_id, network.id))
+
+        for s in network.scenarios:
+            if s.name == "Hobbes Import":
+                return s
+
+        scenario = {
+            "name" : "Hobbes Import",
+            "description" : "Import from hobbes",
+            "resourcescenarios" : [],
+        }
+        return self.connection.call('add_scenario', {'network_id':network.id,
+                                                     'scen':scenario})
+
+    def sync(self, network_id, scenario_id=None, include_timeseries=False, extras=None):
+        """
+            Update a network from the current hobbes network, returning the
+            network and the scenario holding its data.
+
+            If the extras of the nodes have already been fetched, they can be
+            given as (prmname, extras) tuples, so they are not fetched again.
+        """
+        importer = self.importer
+
+        network  = self.fetch_network(network_id)
+        scenario = self.fetch_scenario(network, scenario_id)
+
+        existing_nodes = dict((n.name, n) for n in network.nodes)
+        existing_links = dict((l.name, l) for l in network.links)
+
+        features = OrderedDict()
+        for feature in importer.iter_network():
+            features[feature['properties']['prmname']] = feature
+
+        #A network imported as a subset is kept to that subset, so the rest
+        #of the hobbes network is neither added to it nor compared with it.
+        if importer.subset is not None:
+            selected = importer.subset.select(features.values())
+            features = OrderedDict((name, f) for name, f in features.items()
+                                   if name in selected)
+
+        layouts = dict((name, get_layout(n)) for name, n in existing_nodes.items())
+
+        self.added   = [name for name in features if name not in existing_nodes]
+        self.removed = [name for name in existing_nodes if name not in features]
+        self.changed = [name for name in features if name in existing_nodes and
+                        layouts[name].get('hobbes_hash') != content_hash(features[name])]
+
+        stale = self.find_stale_data(features, layouts)
+
+        #The extras are not part of the feature, so must be fetched to see
+        #whether they have changed. With a cache, unchanged extras cost only
+        #a revalidation request.
+        extras_hashes = {}
+        extras_changed = OrderedDict()
+        if include_timeseries is True:
+            if extras is None:
+                extras = self.fetch_extras(features)
+            for name, extra_data in extras:
+                extras_hashes[name] = content_hash(extra_data)
+                if layouts.get(name, {}).get('hobbes_extras_hash') != extras_hashes[name]:
+                    extras_changed[name] = extra_data
+        self.extras_changed = extras_changed.keys()
+
+        #Nodes and links are built as in a full import. New nodes have
+        #temporary IDs until they have been added.
+        topology = importer.build_topology(features.values(),
+                                           dict((name, n.id) for name, n in existing_nodes.items()))
+
+        #Links are removed first and nodes last, so no link is ever left
+        #referring to a deleted node.
+        self.remove_links(existing_links, topology.link_rows)
+        node_ids = self.sync_nodes(network, topology, layouts, extras_hashes)
+        self.sync_links(network, topology, existing_links)
+        self.remove_nodes(node_ids)
+
+        #Get the network again, so the new nodes' resource attributes are known
+        importer.network = self.connection.call('get_network', {'network_id':network.id,
+                                                                'include_data':'N'})
+        importer.scenario = scenario
+
+        data_features = [features[name] for name in self.added + self.changed]
+
+        uploader = importer.make_uploader(scenario.id)
+        try:
+            for resource_scenario in importer.build_resource_scenarios(False, data_features):
+                uploader.add(resource_scenario)
+
+            for name, extra_data in extras_changed.items():
+                for resource_scenario in importer.build_extras_data(extra_data, node_ids[name]):
+                    uploader.add(resource_scenario)
+        except:
+            uploader.abort()
+            raise
+
+        uploader.close()
+
+        self.remove_stale_data(scenario, stale, node_ids)
+
+        write_output("Sync complete. %s nodes added, %s changed, %s removed. "
+                     "Timeseries changed on %s nodes. %s values removed."
+                     % (len(self.added), len(self.changed), len(self.removed),
+                        len(self.extras_changed), self.data_removed))
+
+        return importer.network, scenario
+
+    def fetch_extras(self, features):
+        """
+            Request the extras of each node with extras, concurrently,
+            returning (prmname, extras) tuples.
+        """
+        importer = self.importer
+        prmnames = [name for name, f in features.items() if has_extras(f['properties'])]
+        if len(prmnames) == 0:
+            return []
+
+        pool = ThreadPool(min(importer.max_connections, len(prmnames)))
+        try:
+            return zip(prmnames, pool.map(importer.fetch_node_extras, prmnames))
+        finally:
+            pool.close()
+            pool.join()
+
+    def sync_nodes(self, network, topology, layouts, extras_hashes):
+        """
+            Add and update nodes so they match the hobbes features.
+            Returns the ID of every node in the network, by name.
+        """
+        importer = self.importer
+
+        node_ids = dict((n.name, n.id) for n in network.nodes)
+
+        def make_nodes(names):
+            nodes = topology.node_dicts(importer.get_type, names)
+            for node in nodes:
+                name = node['name']
+                layout = dict(layouts.get(name, {}))
+                layout.update(node['layout'])
+                if name in extras_hashes:
+                    layout['hobbes_extras_hash'] = extras_hashes[name]
+                node['layout'] = layout
+            return nodes
+
+        if len(self.added) > 0:
+            new_nodes = self.connection.call('add_nodes', {'network_id':network.id,
+                                                           'nodes':make_nodes(self.added)})
+            for n in new_nodes:
+                node_ids[n.name] = n.id
+                topology.set_node_id(n.name, n.id)
+
+        #Nodes whose extras have changed also need their layout updated.
+        to_update = set(self.changed)
+        for name, extras_hash in extras_hashes.items():
+            if name not in self.added and layouts[name].get('hobbes_extras_hash') != extras_hash:
+                to_update.add(name)
+
+        for node in make_nodes(to_update):
+            self.connection.call('update_node', {'node':node})
+
+        return node_ids
+
+    def find_stale_data(self, features, layouts):
+        """
+            Find the attributes which changed nodes had values for, but no
+            longer have in hobbes. Nodes imported before their attributes
+            were recorded in their layout are skipped.
+        """
+        stale = {}
+        for name in self.changed:
+            previous = layouts[name].get('hobbes_attrs')
+            if previous is None:
+                log.warn("Node %s does not record its attributes. Any it no longer has are kept.",
+                         name)
+                continue
+
+            removed = set(previous) - set(data_attributes(features[name]['properties']))
+            if len(removed) > 0:
+                stale[name] = removed
+        return stale
+
+    def remove_stale_data(self, scenario, stale, node_ids):
+        """
+            Delete the values of the stale attributes of each node, so the
+            scenario matches the hobbes network.
+        """
+        importer = self.importer
+        for name, attr_names in stale.items():
+            for attr_name in attr_names:
+                attr = importer.attr_name_map.get(attr_name)
+                if attr is None:
+                    continue
+                ra_id = importer.resource_attr_index.get(('NODE', node_ids[name], attr.id))
+                if ra_id is None:
+                    continue
+                try:
+                    self.connection.call('delete_resource_scenario',
+                                         {'scenario_id'      : scenario.id,
+                                          'resource_attr_id' : ra_id})
+                    self.data_removed += 1
+                except RequestError as e:
+                    #A timeseries which was never imported has no value to delete.
+                    log.debug("No %s value to remove from node %s: %s", attr_name, name, e)
+
+    def remove_nodes(self, node_ids):
+        """
+            Delete the nodes which are no longer in the hobbes network.
+        """
+        for name in self.removed:
+            self.connection.call('delete_node', {'node_id':node_ids.pop(name),
+                                                 'purge_data':'Y'})
+
+    def remove_links(self, existing_links, links):
+        """
+            Delete the links which are no longer in the hobbes network.
+        """
+        for linkname, existing in existing_links.items():
+            if linkname not in links:
+                self.connection.call('delete_link', {'link_id':existing.id,
+                                                     'purge_data':'Y'})
+
+    def sync_links(self, network, topology, existing_links):
+        """
+            Add and update links so they match the origins and terminals
+            of the hobbes features.
+        """
+        #Links to nodes outside a subset are left out, as in the import.
+        complete_only = self.importer.subset is not None
+
+        new_links = []
+        for link in topology.link_dicts(self.importer.get_type, complete_only):
+            linkname = link['name']
+            if link.get('node_1_id') is None or link.get('node_2_id') is None:
+                log.warn("Link %s does not have two ends. Ignoring.", linkname)
+                continue
+
+            if linkname not in existing_links:
+                new_links.append(link)
+            else:
+                existing = existing_links[linkname]
+                if (existing.node_1_id, existing.node_2_id) != (link['node_1_id'], link['node_2_id']):
+                    link['id'] = existing.id
+                    self.connection.call('update_link', {'link':link})
+
+        if len(new_links) > 0:
+            self.connection.call('add_links', {'network_id':network.id,
+                                               'links':new_links})
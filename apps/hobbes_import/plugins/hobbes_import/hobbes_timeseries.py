@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# hobbes_timeseries is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# hobbes_timeseries is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with hobbes_timeseries.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+Conversion of hobbes timeseries to hydra timeseries.
+
+A hobbes timeseries is a header row followed by [date, value] rows, with dates
+as YYYY-MM-DD strings. Whole series are converted at once using numpy arrays,
+rather than creating and formatting a datetime for every point.
+
+Series are encoded in one of two ways:
+
+json    : {"idx1": {date: value, ...}}, the form hydra reads as a timeseries.
+compact : {"start": date, "frequency": freq, "values": [...]} for a series
+          with evenly spaced dates, or {"index": [dates], "values": [...]}
+          otherwise, so each date is not repeated in full for every value.
+          This needs a reader which understands it, so is not the default.
+
+The frequency of a compact series is one of:
+
+<n>D  : every n days.
+<n>M  : every n months, on the day of the month of the start date.
+<n>ME : every n months, on the last day of the month.
+"""
+
+import logging
+
+import json
+
+import re
+
+from datetime import datetime
+
+import numpy as np
+
+from HydraLib.HydraException import HydraPluginError
+
+log = logging.getLogger(__name__)
+
+#strftime directives which can be produced directly from a datetime64[D]
+#array, as (start, end) slices of its YYYY-MM-DD string or as constants,
+#since the hobbes dates have no time component.
+_date_slices = {
+    'Y' : (0, 4),
+    'm' : (5, 7),
+    'd' : (8, 10),
+}
+_constants = {
+    'H' : '00',
+    'M' : '00',
+    'S' : '00',
+    'f' : '000000',
+    '%' : '%',
+}
+
+_directive = re.compile('%(.)')
+
+#The keys of a node's extras which are not timeseries
+NON_TIMESERIES = frozenset(['prmname', 'readme'])
+
+ENCODINGS = ('json', 'compact')
+
+def parse_dates(dates):
+    """
+        Convert a sequence of YYYY-MM-DD strings to a datetime64[D] array.
+    """
+    try:
+        return np.array(dates, dtype='datetime64[D]')
+    except ValueError:
+        #Dates which are not zero-padded, such as 1921-10-1, are not valid
+        #ISO dates, so build them from their components instead.
+        parts = np.array([d.split('-') for d in dates], dtype=int)
+        years  = (parts[:, 0] - 1970).astype('datetime64[Y]')
+        months = years.astype('datetime64[M]') + (parts[:, 1] - 1)
+        days   = months.astype('datetime64[D]') + (parts[:, 2] - 1)
+        #Out of range months or days would otherwise roll over into the next.
+        invalid = (parts[:, 1] < 1) | (parts[:, 1] > 12) | (parts[:, 2] < 1) | \
+            (days.astype('datetime64[M]') != months)
+        if invalid.any():
+            raise ValueError("%s is not a date"%np.array(dates)[invalid][0])
+        return days
+
+def format_dates(dates, timeformat):
+    """
+        Format a datetime64[D] array using a strftime format, returning a
+        list of strings.
+    """
+    iso = np.datetime_as_string(dates, unit='D').astype('S10')
+    chars = iso.view('S1').reshape(len(iso), 10)
+
+    pieces = []
+    position = 0
+    for match in _directive.finditer(timeformat):
+        directive = match.group(1)
+        if directive not in _date_slices and directive not in _constants:
+            #Fall back to strftime for anything less common.
+            return [datetime.strftime(d, timeformat) for d in dates.astype(object)]
+
+        if match.start() > position:
+            pieces.append(timeformat[position:match.start()])
+
+        if directive in _date_slices:
+            start, end = _date_slices[directive]
+            field = np.ascontiguousarray(chars[:, start:end])
+            pieces.append(field.view('S%s'%(end-start)).ravel())
+        else:
+            pieces.append(_constants[directive])
+
+        position = match.end()
+
+    if position < len(timeformat):
+        pieces.append(timeformat[position:])
+
+    formatted = np.zeros(len(iso), dtype='S1')
+    for piece in pieces:
+        if isinstance(piece, str):
+            piece = piece.encode('ascii')
+        formatted = np.char.add(formatted, piece)
+
+    return formatted.astype(str).tolist()
+
+def parse_timeseries(timeseries_value, timeformat, encoding='json', name='timeseries'):
+    """
+        Convert a hobbes timeseries to a hydra timeseries, with each date
+        formatted using timeformat.
+
+        A value which is missing or not a number, a date which cannot be
+        read, or a date given more than once, raises a HydraPluginError
+        naming the series, rather than sending a series hydra would
+        misread. Dates which are out of order are logged.
+    """
+    rows = timeseries_value[1:]
+    if len(rows) == 0:
+        if encoding == 'compact':
+            return {"index": [], "values": []}
+        return {"idx1": {}}
+
+    raw_dates, raw_values = zip(*rows)
+
+    try:
+        dates = parse_dates(raw_dates)
+    except (ValueError, TypeError, IndexError) as e:
+        raise HydraPluginError("Timeseries %s has an invalid date: %s"%(name, e))
+
+    try:
+        values = np.array(raw_values, dtype=float)
+    except (ValueError, TypeError):
+        values = None
+    #None becomes NaN, which is not valid JSON, so is caught here too.
+    if values is None or not np.isfinite(values).all():
+        for date, value in zip(raw_dates, raw_values):
+            try:
+                if np.isfinite(float(value)):
+                    continue
+            except (ValueError, TypeError):
+                pass
+            raise HydraPluginError("Timeseries %s has an invalid value on %s: %r"
+                                   % (name, date, value))
+
+    sorted_dates = np.sort(dates)
+    repeated = sorted_dates[1:][sorted_dates[1:] == sorted_dates[:-1]]
+    if len(repeated) > 0:
+        raise HydraPluginError("Timeseries %s has more than one value on %s"
+                               % (name, ', '.join(np.datetime_as_string(np.unique(repeated)))))
+
+    if (np.diff(dates.astype('int64')) < 0).any():
+        log.warn("The dates of timeseries %s are not in order.", name)
+
+    if encoding == 'compact':
+        return encode_compact(dates, values, timeformat)
+
+    return {"idx1": dict(zip(format_dates(dates, timeformat), values.tolist()))}
+
+def monthly_frequency(dates):
+    """
+        The frequency of dates which are a constant number of months apart,
+        either on the same day of the month or on the last day of each
+        month, or None if they are not.
+    """
+    months = dates.astype('datetime64[M]')
+    steps = np.diff(months.astype('int64'))
+    if len(steps) == 0 or steps[0] <= 0 or not (steps == steps[0]).all():
+        return None
+
+    days = (dates - months).astype('int64')
+    if (days == days[0]).all():
+        return "%sM"%steps[0]
+
+    #The day after each date is the first of the next month.
+    if (dates + 1 == (months + 1).astype('datetime64[D]')).all():
+        return "%sME"%steps[0]
+
+    return None
+
+def encode_compact(dates, values, timeformat):
+    """
+        Encode a series as its start and frequency, if its dates are evenly
+        spaced in days or months, or else as parallel arrays of dates and
+        values, sorted by date. The dates must be distinct.
+    """
+    steps = np.diff(dates.astype('int64'))
+    if len(steps) > 0 and steps[0] > 0 and (steps == steps[0]).all():
+        frequency = "%sD"%steps[0]
+    else:
+        frequency = monthly_frequency(dates)
+
+    if frequency is not None:
+        return {"start"    : format_dates(dates[:1], timeformat)[0],
+                "frequency": frequency,
+                "values"   : values.tolist()}
+
+    order = np.argsort(dates)
+
+    return {"index" : format_dates(dates[order], timeformat),
+            "values": values[order].tolist()}
+
+def convert_extras(extra_data, timeformat, encoding='json'):
+    """
+        Convert the timeseries in the extras of a node to hydra timeseries,
+        returning a list of (name, value) tuples, with each value already
+        serialised as JSON, without spaces.
+    """
+    prmname = extra_data.get('prmname')
+
+    converted = []
+    for k, v in extra_data.items():
+        if k in NON_TIMESERIES or len(v) < 2:
+            continue
+        name = "%s of node %s"%(k, prmname)
+        converted.append((k, json.dumps(parse_timeseries(v, timeformat, encoding, name),
+                                        separators=(',', ':'))))
+    return converted
+
+def convert_extras_body(body, timeformat, encoding='json'):
+    """
+        Decode and convert the body of a network/extras response. This is
+        what each process does when converting in a process pool: only the
+        raw body is sent to it, and only the serialised series come back.
+    """
+    return convert_extras(json.loads(body), timeformat, encoding)
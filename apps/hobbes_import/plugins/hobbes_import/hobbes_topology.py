@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# hobbes_topology is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# hobbes_topology is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with hobbes_topology.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+A compact, column-based store of the nodes and links of the hobbes network,
+used while building the network to send to hydra.
+"""
+
+import logging
+
+from array import array
+
+import numpy as np
+
+from hobbes_sync import content_hash, data_attributes
+from hobbes_geometry import node_coordinates
+
+log = logging.getLogger(__name__)
+
+def intern_name(name):
+    """
+        Intern a name, so it is held once however many nodes and links refer
+        to it. Names which are not ASCII are returned unchanged.
+    """
+    if isinstance(name, unicode):
+        try:
+            name = name.encode('ascii')
+        except UnicodeEncodeError:
+            return name
+    return intern(name)
+
+class NetworkTopology(object):
+    """
+        The nodes and links of a network, held as one array (or list) per
+        field rather than one dict per resource. Nodes and links are
+        referred to by their row. Hydra nodes and links are only made, by
+        node_dicts and link_dicts, when the network is sent to hydra.
+    """
+    def __init__(self):
+        #Nodes. x and y are in the hobbes CRS until reproject is called.
+        self.node_names   = []
+        self.node_rows    = {}
+        self.node_ids     = array('l')
+        self.x            = array('d')
+        self.y            = array('d')
+        self.node_types   = array('i')
+        self.descriptions = []
+        self.hashes       = []
+        self.attributes   = []
+
+        #Node types, referred to by their position in type_names
+        self.type_names = []
+        self.type_rows  = {}
+
+        #Links. An end which has not been seen yet is -1.
+        self.link_names = []
+        self.link_rows  = {}
+        self.link_ids   = array('l')
+        self.node_1     = array('l')
+        self.node_2     = array('l')
+
+    def num_nodes(self):
+        return len(self.node_names)
+
+    def num_links(self):
+        return len(self.link_names)
+
+    def type_row(self, type_name):
+        row = self.type_rows.get(type_name)
+        if row is None:
+            row = self.type_rows[type_name] = len(self.type_names)
+            self.type_names.append(type_name)
+        return row
+
+    def add_node(self, feature, node_id):
+        """
+            Add a hobbes feature as a node, returning its row.
+        """
+        props = feature['properties']
+        x, y = node_coordinates(feature)
+
+        row = len(self.node_names)
+        name = intern_name(props['prmname'])
+        self.node_names.append(name)
+        self.node_rows[name] = row
+        self.node_ids.append(node_id)
+        self.x.append(x)
+        self.y.append(y)
+        self.node_types.append(self.type_row(props['type']))
+        self.descriptions.append(props['description'])
+        #The hash is kept so later syncs can tell whether the node has changed.
+        self.hashes.append(content_hash(feature))
+        #So a sync can remove the values of attributes the node loses.
+        self.attributes.append([intern_name(a) for a in data_attributes(props)])
+
+        return row
+
+    def add_links(self, props, node_row, link_ids):
+        """
+            Add the links into and out of a node. A link is created the first
+            time either of its ends is seen, and its other end is filled in
+            when that node is reached.
+        """
+        for o in props.get('origins', []):
+            self.node_2[self.link_row(o['link_prmname'], link_ids)] = node_row
+
+        for t in props.get('terminals', []):
+            self.node_1[self.link_row(t['link_prmname'], link_ids)] = node_row
+
+    def reproject(self, transform):
+        """
+            Reproject the coordinates of every node at once, using a
+            CoordinateTransform.
+        """
+        if transform.is_identity() or len(self.x) == 0:
+            return
+
+        x, y = transform.transform(np.frombuffer(self.x, dtype='d'),
+                                   np.frombuffer(self.y, dtype='d'))
+        self.x = array('d', x.tostring())
+        self.y = array('d', y.tostring())
+
+    def link_row(self, linkname, link_ids):
+        row = self.link_rows.get(linkname)
+        if row is None:
+            linkname = intern_name(linkname)
+            row = self.link_rows[linkname] = len(self.link_names)
+            self.link_names.append(linkname)
+            self.link_ids.append(link_ids.next())
+            self.node_1.append(-1)
+            self.node_2.append(-1)
+        return row
+
+    def set_node_id(self, name, node_id):
+        """
+            Set the ID of a node, once hydra has assigned it.
+        """
+        self.node_ids[self.node_rows[name]] = node_id
+
+    def node_dicts(self, get_type, names=None):
+        """
+            Make the hydra nodes, or only the named ones. The types and
+            attributes of nodes of the same type are shared rather than
+            copied.
+        """
+        if names is None:
+            rows = xrange(len(self.node_names))
+        else:
+            rows = [self.node_rows[name] for name in names]
+
+        types = {}
+        nodes = []
+        for row in rows:
+            type_row = self.node_types[row]
+            if type_row not in types:
+                types[type_row] = get_type(self.type_names[type_row])
+            node_types, node_attributes = types[type_row]
+            nodes.append(dict(
+                id = self.node_ids[row],
+                name = self.node_names[row],
+                x = str(self.x[row]),
+                y = str(self.y[row]),
+                description = self.descriptions[row],
+                attributes = node_attributes,
+                types = node_types,
+                layout = {'hobbes_hash' : self.hashes[row],
+                          'hobbes_attrs': self.attributes[row]},
+            ))
+        return nodes
+
+    def link_dicts(self, get_type, complete_only=False):
+        """
+            Make the hydra links. If complete_only is set, links without a
+            node at both ends are left out.
+        """
+        link_types, link_attributes = get_type('HobbesLink')
+
+        links = []
+        for row in xrange(len(self.link_names)):
+            node_1, node_2 = self.node_1[row], self.node_2[row]
+            if complete_only is True and (node_1 < 0 or node_2 < 0):
+                continue
+
+            link = dict(
+                id = self.link_ids[row],
+                name = self.link_names[row],
+                attributes = link_attributes,
+                description = "",
+                types = link_types,
+            )
+            if node_1 >= 0:
+                link['node_1_id'] = self.node_ids[node_1]
+            if node_2 >= 0:
+                link['node_2_id'] = self.node_ids[node_2]
+            links.append(link)
+        return links
@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# hobbes_watch is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# hobbes_watch is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with hobbes_watch.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+Continuous sync of a hydra network with the hobbes network.
+
+The hobbes network (and, if timeseries are included, the extras of each
+node) is polled at a fixed interval. With a cache, each poll only makes
+conditional requests, and the bodies of the responses are hashed, so a
+poll which finds nothing new sends nothing to hydra. When something has
+changed, the network is synced with HobbesSync, which sends only the nodes,
+links and data which have changed.
+"""
+
+import logging
+
+import hashlib
+
+import json
+
+import os
+
+import time
+
+from multiprocessing.pool import ThreadPool
+
+from HydraLib.PluginLib import write_output
+
+from hobbes_sync import HobbesSync, has_extras
+
+log = logging.getLogger(__name__)
+
+def body_hash(body):
+    return hashlib.sha1(body).hexdigest()
+
+class WatchStats(object):
+    """
+        Counters of a watch, written to the status file after every poll.
+
+        The lag of a sync is the time from the start of the previous poll,
+        the last time the change had not been seen, until the change was
+        in hydra: an upper bound on how stale hydra was.
+    """
+    def __init__(self):
+        self.started   = time.time()
+        self.polls     = 0
+        self.syncs     = 0
+        self.errors    = 0
+        self.last_poll = None
+        self.last_sync = None
+        self.last_error = None
+        self.lag       = None
+        self.max_lag   = None
+
+        self.nodes_added    = 0
+        self.nodes_changed  = 0
+        self.nodes_removed  = 0
+        self.extras_changed = 0
+        self.sync_time      = 0.0
+
+        self.http_requests = 0
+        self.http_bytes    = 0
+        self.hydra_calls   = 0
+
+    def record_sync(self, hobbes_sync, lag, sync_time):
+        self.syncs += 1
+        self.last_sync = time.time()
+        self.lag = lag
+        if self.max_lag is None or lag > self.max_lag:
+            self.max_lag = lag
+        self.nodes_added    += len(hobbes_sync.added)
+        self.nodes_changed  += len(hobbes_sync.changed)
+        self.nodes_removed  += len(hobbes_sync.removed)
+        self.extras_changed += len(hobbes_sync.extras_changed)
+        self.sync_time += sync_time
+
+    def to_dict(self):
+        stats = dict(self.__dict__)
+        uptime = time.time() - self.started
+        num_synced = self.nodes_added + self.nodes_changed + self.nodes_removed + \
+            self.extras_changed
+        #Throughput while syncing, and the load on hobbes overall
+        stats['nodes_per_second'] = num_synced / self.sync_time if self.sync_time > 0 else 0.0
+        stats['requests_per_minute'] = 60.0 * self.http_requests / uptime if uptime > 0 else 0.0
+        return stats
+
+    def write(self, path):
+        """
+            Write the counters to a JSON file, replacing it atomically so
+            a monitor never reads a partial file.
+        """
+        tmp_path = "%s.%s.tmp"%(path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+
+class HobbesWatcher(object):
+    """
+        Keeps a hydra network in sync with the hobbes network, polling
+        hobbes every 'interval' seconds.
+    """
+    def __init__(self, importer, network_id, scenario_id=None, include_timeseries=False,
+                 interval=300, status_file=None):
+        self.importer    = importer
+        self.client      = importer.client
+        self.network_id  = network_id
+        self.scenario_id = scenario_id
+        self.include_timeseries = include_timeseries
+        self.interval    = interval
+        self.status_file = status_file
+
+        #The hashes of the responses seen by the last poll
+        self.network_hash  = None
+        self.extras_hashes = {}
+
+        self.stats = WatchStats()
+        self.previous_poll = None
+
+        if self.client.cache is None:
+            log.warn("Watching without a cache: every poll downloads the whole network.")
+
+    def fetch_extras_bodies(self, features):
+        """
+            The body of the extras response of each node with extras, by
+            prmname.
+        """
+        prmnames = [f['properties']['prmname'] for f in features
+                    if has_extras(f['properties'])]
+        if len(prmnames) == 0:
+            return {}
+
+        def fetch(prmname):
+            return prmname, self.client.get_extras_body(prmname)
+
+        pool = ThreadPool(min(self.importer.max_connections, len(prmnames)))
+        try:
+            return dict(pool.map(fetch, prmnames))
+        finally:
+            pool.close()
+            pool.join()
+
+    def poll(self):
+        """
+            Check hobbes for changes, syncing the network if there are any.
+            Returns True if the network was synced.
+        """
+        poll_start = time.time()
+        importer = self.importer
+
+        body = self.client.get("network/get")
+        network_hash = body_hash(body)
+        changed = network_hash != self.network_hash
+
+        if changed is True and importer.stream is False:
+            importer.json_net = self.client.parse(body)
+        del body
+
+        extras_hashes = self.extras_hashes
+        extras = None
+        if self.include_timeseries is True:
+            extras_bodies = self.fetch_extras_bodies(importer.iter_network())
+            extras_hashes = dict((prmname, body_hash(extras_body))
+                                 for prmname, extras_body in extras_bodies.items())
+            changed = changed or extras_hashes != self.extras_hashes
+            #The sync uses the extras fetched here, rather than fetching them again.
+            extras = ((prmname, self.client.parse(extras_body))
+                      for prmname, extras_body in extras_bodies.items())
+
+        if changed is True:
+            hobbes_sync = HobbesSync(importer)
+            hobbes_sync.sync(self.network_id, self.scenario_id, self.include_timeseries,
+                             extras=extras)
+            synced = time.time()
+
+            #Only once the sync has succeeded are the changes marked as seen.
+            self.network_hash  = network_hash
+            self.extras_hashes = extras_hashes
+
+            if self.previous_poll is not None:
+                lag = synced - self.previous_poll
+            else:
+                lag = synced - poll_start
+            self.stats.record_sync(hobbes_sync, lag, synced - poll_start)
+
+        self.previous_poll = poll_start
+        self.stats.last_poll = poll_start
+        self.stats.polls += 1
+
+        return changed
+
+    def counters(self):
+        return (self.client.num_requests, self.client.bytes_received,
+                getattr(self.importer.connection, 'num_calls', 0))
+
+    def run(self, max_polls=None):
+        """
+            Poll until interrupted, or until max_polls polls have been made.
+            A failed poll is logged and retried at the next interval, so a
+            temporary outage of hobbes or hydra does not stop the watch.
+        """
+        write_output("Watching %s for changes every %s seconds"
+                     % (self.client.url, self.interval))
+
+        while max_polls is None or self.stats.polls < max_polls:
+            poll_start = time.time()
+            before = self.counters()
+            try:
+                synced = self.poll()
+            except KeyboardInterrupt:
+                break
+            except Exception as e:
+                log.exception(e)
+                self.stats.polls += 1
+                self.stats.errors += 1
+                self.stats.last_error = str(e)
+                synced = False
+
+            after = self.counters()
+            self.stats.http_requests += after[0] - before[0]
+            self.stats.http_bytes    += after[1] - before[1]
+            self.stats.hydra_calls   += after[2] - before[2]
+
+            if synced is True:
+                write_output("Synced in %.1fs. Lag %.1fs."
+                             % (time.time() - poll_start, self.stats.lag))
+            log.info("Poll %s: %s hobbes requests (%s bytes), %s hydra calls",
+                     self.stats.polls, after[0] - before[0], after[1] - before[1],
+                     after[2] - before[2])
+
+            if self.client.cache is not None:
+                self.client.cache.evict()
+            if self.status_file is not None:
+                self.stats.write(self.status_file)
+
+            if max_polls is not None and self.stats.polls >= max_polls:
+                break
+            try:
+                time.sleep(max(0, poll_start + self.interval - time.time()))
+            except KeyboardInterrupt:
+                break
+
+        return self.stats
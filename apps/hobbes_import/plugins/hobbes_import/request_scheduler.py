@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# request_scheduler is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# request_scheduler is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with request_scheduler.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+Scheduling of requests to the hobbes server: limits on the number of
+concurrent requests and the rate of requests to each host, timeouts, and
+retries with backoff when the server is overloaded or unavailable.
+
+The concurrency limit of a host adapts to how it responds. It grows by one
+request for each round of requests answered promptly, and halves when a
+request fails or times out, or when several responses in a row are much
+slower than the recent average.
+"""
+
+import logging
+
+import random
+
+import time
+
+from threading import Condition, Lock
+
+from urlparse import urlparse
+
+import requests
+
+from HydraLib.HydraException import HydraPluginError
+
+log = logging.getLogger(__name__)
+
+#Responses which mean the request may succeed if it is tried again later
+RETRY_STATUS = frozenset([429, 500, 502, 503, 504])
+
+class HostLimiter(object):
+    """
+        The concurrency and rate limits of requests to a single host.
+    """
+    def __init__(self, max_connections=8, max_rate=0, slow_factor=3.0, slow_count=3,
+                 smoothing=0.1):
+        self.max_connections = max_connections
+        #Requests per second. 0 means unlimited.
+        self.max_rate    = max_rate
+        #slow_count responses in a row, each this many times slower than
+        #the average, count as a sign of overload.
+        self.slow_factor = slow_factor
+        self.slow_count  = slow_count
+        #The weight of each response in the moving average of the latency
+        self.smoothing   = smoothing
+
+        self.condition = Condition(Lock())
+        self.limit  = float(max_connections)
+        self.active = 0
+
+        self.next_start = 0.0
+        self.latency    = None
+        self.num_slow   = 0
+
+    def acquire(self):
+        """
+            Wait until a request may start.
+        """
+        with self.condition:
+            while self.active >= int(self.limit):
+                self.condition.wait()
+            self.active += 1
+
+            #Space the starts of requests evenly to respect the rate limit.
+            delay = 0.0
+            if self.max_rate > 0:
+                now = time.time()
+                start = max(now, self.next_start)
+                self.next_start = start + 1.0 / self.max_rate
+                delay = start - now
+
+        if delay > 0:
+            time.sleep(delay)
+
+    def release(self, latency=None, failed=False):
+        """
+            Record the end of a request, adjusting the concurrency limit.
+        """
+        with self.condition:
+            self.active -= 1
+
+            slow = False
+            if latency is not None and failed is False:
+                if self.latency is None:
+                    self.latency = latency
+                slow = latency > self.slow_factor * self.latency
+                #The average follows a sustained rise, so it is a baseline
+                #of recent responses rather than the fastest ever seen.
+                self.latency += self.smoothing * (latency - self.latency)
+
+                if slow is True:
+                    self.num_slow += 1
+                    if self.num_slow >= self.slow_count:
+                        failed = True
+                else:
+                    self.num_slow = 0
+
+            if failed is True:
+                self.limit = max(1.0, self.limit / 2)
+                self.num_slow = 0
+                log.debug("Reduced concurrency limit to %s", int(self.limit))
+            elif slow is False:
+                self.limit = min(float(self.max_connections), self.limit + 1.0 / self.limit)
+
+            self.condition.notify_all()
+
+class RequestScheduler(object):
+    """
+        Makes GET requests through a requests session, within the limits of
+        a HostLimiter for each host, retrying failed requests with jittered
+        exponential backoff.
+
+        The concurrency limit applies until the headers of a response are
+        received. The body is read by the caller.
+    """
+    def __init__(self, max_connections=8, max_rate=0, timeout=60, max_retries=5,
+                 backoff=1.0, max_backoff=60.0):
+        self.max_connections = max_connections
+        self.max_rate    = max_rate
+        self.timeout     = timeout
+        self.max_retries = max_retries
+        self.backoff     = backoff
+        self.max_backoff = max_backoff
+
+        self.lock  = Lock()
+        self.hosts = {}
+        self.num_retries = 0
+
+    def host(self, url):
+        netloc = urlparse(url).netloc
+        with self.lock:
+            limiter = self.hosts.get(netloc)
+            if limiter is None:
+                limiter = self.hosts[netloc] = HostLimiter(self.max_connections, self.max_rate)
+        return limiter
+
+    def retry_delay(self, attempt, response=None):
+        """
+            How long to wait before the next attempt: the server's Retry-After,
+            if it gave one, or else a random time up to an exponentially
+            growing limit.
+        """
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after is not None and retry_after.isdigit():
+                return min(float(retry_after), self.max_backoff)
+
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def get(self, session, url, **kwargs):
+        """
+            Request a URL, returning the response. Responses other than those
+            in RETRY_STATUS are returned as they are, for the caller to check.
+        """
+        limiter = self.host(url)
+
+        attempt = 0
+        while True:
+            limiter.acquire()
+            start = time.time()
+            try:
+                response = session.get(url, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                limiter.release(failed=True)
+                error, response = e, None
+            else:
+                if response.status_code not in RETRY_STATUS:
+                    limiter.release(latency=time.time() - start)
+                    return response
+                limiter.release(failed=True)
+                response.close()
+                error = "status code %s"%response.status_code
+
+            if attempt >= self.max_retries:
+                raise HydraPluginError("Request to %s failed after %s attempts: %s"
+                                       % (url, attempt + 1, error))
+
+            delay = self.retry_delay(attempt, response)
+            log.warn("Request to %s failed (%s). Retrying in %.1fs.", url, error, delay)
+            with self.lock:
+                self.num_retries += 1
+            time.sleep(delay)
+            attempt += 1
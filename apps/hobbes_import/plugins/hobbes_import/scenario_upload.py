@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# scenario_upload is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# scenario_upload is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with scenario_upload.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+Batched upload of resource scenarios to an existing Hydra scenario.
+"""
+
+import logging
+
+from threading import Thread, Lock
+
+from Queue import Queue
+
+from HydraLib.HydraException import HydraPluginError
+
+log = logging.getLogger(__name__)
+
+class ScenarioUploader(object):
+    """
+        Uploads resource scenarios to a scenario which already exists in Hydra,
+        in batches of 'batch_size', using 'update_resourcedata'.
+
+        Batches are sent by 'workers' background threads, so the next batch
+        can be built while the previous ones are uploading. At most
+        'max_pending' batches wait to be sent at any time; adding more blocks
+        until one has been taken by a worker. Each batch's payload is
+        released once Hydra has accepted it.
+
+        If given, on_upload is called with each batch once it is accepted,
+        and deduplicator replaces repeated datasets with references before
+        each batch is sent.
+    """
+    def __init__(self, connection, scenario_id, batch_size=500, max_pending=2,
+                 on_upload=None, deduplicator=None, workers=1):
+
+        self.connection  = connection
+        self.scenario_id = scenario_id
+        self.batch_size  = batch_size
+        self.on_upload   = on_upload
+        self.deduplicator = deduplicator
+
+        self.batch = []
+        self.num_uploaded = 0
+        self.num_batches  = 0
+        self.error = None
+        self.lock = Lock()
+
+        self.queue = Queue(maxsize=max_pending)
+        self.workers = []
+        for i in range(max(1, workers)):
+            worker = Thread(target=self._upload_batches)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def _upload_batches(self):
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                break
+
+            #Once an upload has failed, the remaining batches are discarded.
+            if self.error is not None:
+                continue
+
+            try:
+                if self.deduplicator is not None:
+                    batch = self.deduplicator.resolve(self.connection, batch)
+
+                self.connection.call('update_resourcedata',
+                                     {'scenario_id'        : self.scenario_id,
+                                      'resource_scenarios' : batch})
+                with self.lock:
+                    self.num_uploaded += len(batch)
+                    self.num_batches += 1
+                    num_batches = self.num_batches
+                log.info("Uploaded batch %s (%s resource scenarios)",
+                         num_batches, len(batch))
+                if self.on_upload is not None:
+                    self.on_upload(batch)
+            except Exception as e:
+                log.exception(e)
+                self.error = e
+
+            #Release the batch now that Hydra has accepted it.
+            del batch
+
+    def _check_error(self):
+        if self.error is not None:
+            raise HydraPluginError("An error occurred uploading data to scenario %s: %s"
+                                   % (self.scenario_id, self.error))
+
+    def add(self, resource_scenario):
+        """
+            Queue a resource scenario for upload, sending a batch when
+            batch_size have accumulated.
+        """
+        self._check_error()
+        self.batch.append(resource_scenario)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+            Send the current batch, even if it is not full.
+        """
+        if len(self.batch) > 0:
+            self.queue.put(self.batch)
+            self.batch = []
+
+    def close(self):
+        """
+            Send any remaining resource scenarios and wait for all the
+            batches to be accepted.
+        """
+        self.flush()
+        self._stop_workers()
+        self._check_error()
+
+    def abort(self):
+        """
+            Stop uploading, discarding anything not yet sent.
+        """
+        self.batch = []
+        if self.error is None:
+            self.error = HydraPluginError("Upload aborted")
+        self._stop_workers()
+
+    def _stop_workers(self):
+        for worker in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
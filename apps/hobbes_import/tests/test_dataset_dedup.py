@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# test_dataset_dedup is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# test_dataset_dedup is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with test_dataset_dedup.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+Tests of the content-addressed deduplication of datasets.
+"""
+
+import os, sys
+
+import itertools
+
+import unittest
+
+__location__ = os.path.split(os.path.abspath(__file__))[0]
+
+sys.path.insert(0, os.path.join(__location__, '..', 'plugins', 'hobbes_import'))
+
+from dataset_dedup import dataset_hash, DatasetDeduplicator
+
+def make_dataset(**kwargs):
+    dataset = dict(type='timeseries',
+                   name='storage of node SR_SHA',
+                   value='{"0": {"1950-01-01": 1.0}}',
+                   unit='-',
+                   dimension='dimensionless',
+                   metadata='{}')
+    dataset.update(kwargs)
+    return dataset
+
+class BulkInsertConnection(object):
+    """
+        Records the datasets created, giving each a new ID.
+    """
+    def __init__(self):
+        self.ids = itertools.count(1)
+        self.inserted = []
+
+    def call(self, func, args):
+        assert func == 'bulk_insert_data'
+        self.inserted.extend(args['bulk_data'])
+        return [next(self.ids) for d in args['bulk_data']]
+
+class DatasetHashTest(unittest.TestCase):
+
+    def test_name_ignored(self):
+        self.assertEqual(dataset_hash(make_dataset()),
+                         dataset_hash(make_dataset(name='storage of node SR_ORO')))
+
+    def test_content(self):
+        base = dataset_hash(make_dataset())
+        self.assertNotEqual(base, dataset_hash(make_dataset(value='{"0": {"1950-01-01": 2.0}}')))
+        self.assertNotEqual(base, dataset_hash(make_dataset(type='descriptor')))
+        self.assertNotEqual(base, dataset_hash(make_dataset(unit='KAF')))
+        self.assertNotEqual(base, dataset_hash(make_dataset(metadata='{"encoding": "compact"}')))
+
+class DatasetDeduplicatorTest(unittest.TestCase):
+
+    def test_resolve(self):
+        connection = BulkInsertConnection()
+        deduplicator = DatasetDeduplicator()
+
+        batch = [{'resource_attr_id':1, 'value':make_dataset()},
+                 {'resource_attr_id':2, 'value':make_dataset(name='storage of node SR_ORO')},
+                 {'resource_attr_id':3, 'value':make_dataset(value='{"0": {"1950-01-01": 2.0}}')}]
+        deduplicator.resolve(connection, batch)
+
+        self.assertEqual([rs['value'] for rs in batch], [{'id':1}, {'id':1}, {'id':2}])
+        self.assertEqual(len(connection.inserted), 2)
+
+        #A dataset seen in an earlier batch is not created again.
+        batch = [{'resource_attr_id':4, 'value':make_dataset()}]
+        deduplicator.resolve(connection, batch)
+        self.assertEqual(batch[0]['value'], {'id':1})
+        self.assertEqual(len(connection.inserted), 2)
+
+        self.assertEqual((deduplicator.num_datasets, deduplicator.num_unique), (4, 2))
+        self.assertEqual(deduplicator.ratio, 2.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# test_hobbes_client is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# test_hobbes_client is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with test_hobbes_client.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+Tests of the on-disk cache of hobbes responses.
+"""
+
+import os, sys
+
+import shutil
+
+import tempfile
+
+import unittest
+
+from threading import Thread
+
+__location__ = os.path.split(os.path.abspath(__file__))[0]
+
+sys.path.insert(0, os.path.join(__location__, '..', 'plugins', 'hobbes_import'))
+
+from hobbes_client import HobbesCache
+
+URL = 'http://cwn.casil.ucdavis.edu/network/get'
+
+class HobbesCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = HobbesCache(self.cache_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_put(self):
+        self.cache.put(URL, {'ETag':'"1"'}, '[1, 2, 3]')
+        self.assertEqual(self.cache.get_meta(URL)['etag'], '"1"')
+        self.assertEqual(self.cache.open(URL).read(), '[1, 2, 3]')
+
+    def test_concurrent_writes(self):
+        #Shards streaming the network write the same entry at once.
+        self.cache.put(URL, {}, '[]')
+        errors = []
+
+        def write():
+            try:
+                for i in range(50):
+                    self.cache.touch(URL)
+                    self.cache.put(URL, {'ETag':'"2"'}, '[]')
+            except Exception as e:
+                errors.append(e)
+
+        threads = [Thread(target=write) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(self.cache.open(URL).read(), '[]')
+        #No temporary files are left behind.
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# test_hobbes_shards is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# test_hobbes_shards is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with test_hobbes_shards.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+Tests of the planning of the data import into shards.
+"""
+
+import os, sys
+
+import unittest
+
+__location__ = os.path.split(os.path.abspath(__file__))[0]
+
+sys.path.insert(0, os.path.join(__location__, '..', 'plugins', 'hobbes_import'))
+
+from hobbes_shards import plan_shards, node_sizes, estimate_size, SCALAR_BYTES, TIMESERIES_BYTES
+
+def make_feature(prmname, num_scalars=2, extras=()):
+    props = {'prmname':prmname, 'type':'Junction', 'description':'',
+             'origins':[], 'terminals':[], 'regions':[]}
+    for i in range(num_scalars):
+        props['param_%s'%i] = float(i)
+    if len(extras) > 0:
+        props['extras'] = dict((e, {}) for e in extras)
+    return {'properties':props}
+
+class EstimateSizeTest(unittest.TestCase):
+
+    def test_scalars(self):
+        props = make_feature('A', num_scalars=3)['properties']
+        self.assertEqual(estimate_size(props), 3 * SCALAR_BYTES)
+
+    def test_timeseries(self):
+        props = make_feature('A', num_scalars=1, extras=['inflow', 'storage'])['properties']
+        self.assertEqual(estimate_size(props), SCALAR_BYTES + 2 * TIMESERIES_BYTES)
+        self.assertEqual(estimate_size(props, include_timeseries=False), SCALAR_BYTES)
+
+class PlanShardsTest(unittest.TestCase):
+
+    def test_max_nodes(self):
+        shards = plan_shards([('N%s'%i, 10) for i in range(25)], max_nodes=10)
+        self.assertEqual([len(s) for s in shards], [10, 10, 5])
+        self.assertEqual([s.index for s in shards], [0, 1, 2])
+        #The order of the network is kept.
+        self.assertEqual(sum((s.prmnames for s in shards), []), ['N%s'%i for i in range(25)])
+
+    def test_max_size(self):
+        sizes = [40, 40, 40, 100, 10, 10]
+        shards = plan_shards([('N%s'%i, size) for i, size in enumerate(sizes)],
+                             max_nodes=10, max_size=100)
+        #A node larger than max_size has a shard of its own.
+        self.assertEqual([s.prmnames for s in shards],
+                         [['N0', 'N1'], ['N2'], ['N3'], ['N4', 'N5']])
+        self.assertEqual([s.size for s in shards], [80, 40, 100, 20])
+
+    def test_empty(self):
+        self.assertEqual(plan_shards([]), [])
+
+    def test_node_sizes(self):
+        features = [make_feature('A', num_scalars=1), make_feature('B', extras=['inflow'])]
+        self.assertEqual(list(node_sizes(features)),
+                         [('A', SCALAR_BYTES), ('B', 2 * SCALAR_BYTES + TIMESERIES_BYTES)])
+        self.assertEqual(list(node_sizes(features, include_timeseries=False)),
+                         [('A', SCALAR_BYTES), ('B', 2 * SCALAR_BYTES)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# test_hobbes_subset is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# test_hobbes_subset is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with test_hobbes_subset.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+Tests of the selection of regions and catchments of the hobbes network.
+"""
+
+import os, sys
+
+import unittest
+
+__location__ = os.path.split(os.path.abspath(__file__))[0]
+
+sys.path.insert(0, os.path.join(__location__, '..', 'plugins', 'hobbes_import'))
+
+from HydraLib.HydraException import HydraPluginError
+
+from hobbes_subset import NetworkSubset
+
+def make_network(links, regions):
+    """
+        Features with the given links, as (from, to) pairs, and regions, by
+        node name.
+    """
+    features = dict((name, {'properties':{'prmname':name, 'regions':node_regions,
+                                          'origins':[], 'terminals':[]}})
+                    for name, node_regions in regions.items())
+    for node_1, node_2 in links:
+        linkname = '%s-%s'%(node_1, node_2)
+        features[node_1]['properties']['terminals'].append({'link_prmname':linkname})
+        features[node_2]['properties']['origins'].append({'link_prmname':linkname})
+    return [features[name] for name in sorted(features)]
+
+#A flows to B, which flows to C along with D. E is not connected.
+NETWORK = make_network([('A', 'B'), ('B', 'C'), ('D', 'C')],
+                       {'A':['North'], 'B':['North'], 'C':['South'],
+                        'D':['South'], 'E':['North', 'South']})
+
+class NetworkSubsetTest(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertTrue(NetworkSubset().is_empty())
+        self.assertFalse(NetworkSubset(regions=['North']).is_empty())
+
+    def test_regions(self):
+        subset = NetworkSubset(regions=['North'])
+        self.assertEqual(subset.select(NETWORK), set(['A', 'B', 'E']))
+        self.assertEqual(subset.members['North'], set(['A', 'B', 'E']))
+
+        subset = NetworkSubset(regions=['North', 'South'])
+        self.assertEqual(subset.select(NETWORK), set('ABCDE'))
+
+    def test_upstream(self):
+        subset = NetworkSubset(upstream_of='C')
+        self.assertEqual(subset.select(NETWORK), set('ABCD'))
+        self.assertEqual(subset.members.keys(), ['Upstream of C'])
+
+    def test_downstream(self):
+        subset = NetworkSubset(downstream_of='B')
+        self.assertEqual(subset.select(NETWORK), set('BC'))
+
+    def test_combined(self):
+        #Only the nodes which satisfy all the filters are selected, and
+        #each group holds only selected nodes.
+        subset = NetworkSubset(regions=['South'], upstream_of='C')
+        self.assertEqual(subset.select(NETWORK), set('CD'))
+        self.assertEqual(subset.members['South'], set('CD'))
+        self.assertEqual(subset.members['Upstream of C'], set('CD'))
+
+    def test_unknown_node(self):
+        subset = NetworkSubset(upstream_of='Z')
+        self.assertRaises(HydraPluginError, subset.select, NETWORK)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# test_hobbes_sync is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# test_hobbes_sync is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with test_hobbes_sync.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+Tests of the incremental sync of a hydra network with the hobbes network.
+
+The network is a synthetic one, and hydra is the in-memory fake connection
+of the benchmarks.
+"""
+
+import os, sys
+
+import copy
+
+import unittest
+
+from collections import OrderedDict
+
+__location__ = os.path.split(os.path.abspath(__file__))[0]
+
+sys.path.insert(0, os.path.join(__location__, '..', 'plugins', 'hobbes_import'))
+sys.path.insert(0, os.path.join(__location__, '..', 'benchmark'))
+
+from hobbes_import import HobbesImporter
+from hobbes_sync import HobbesSync, content_hash
+from hobbes_subset import NetworkSubset
+from create_hobbes_template import HobbesTemplateBuilder
+
+from synthetic_network import SyntheticHobbesNetwork
+from fake_connection import FakeConnection
+
+def import_network(features, **kwargs):
+    """
+        Import the features, without their timeseries, into a new fake hydra.
+    """
+    importer = HobbesImporter(session_id='test', **kwargs)
+    importer.connection = FakeConnection()
+    importer.json_net = features
+
+    tmpl = HobbesTemplateBuilder(client=importer.client)
+    importer.upload_template(tmpl.convert(features))
+    importer.import_network_topology()
+    importer.import_data(include_timeseries=False)
+    return importer
+
+def describe_network(importer):
+    """
+        The nodes, their layouts and the ends of the links of the imported
+        network, in a form which does not depend on the IDs hydra assigned.
+    """
+    network = importer.connection.networks[importer.network.id]
+    names = dict((n['id'], n['name']) for n in network['nodes'])
+    nodes = sorted((n['name'], n['x'], n['y'], n['description'],
+                    n['layout']['hobbes_hash'], tuple(n['layout']['hobbes_attrs']))
+                   for n in network['nodes'])
+    links = sorted((l['name'], names[l['node_1_id']], names[l['node_2_id']])
+                   for l in network['links'])
+    return nodes, links
+
+def remove_node(features, index):
+    """
+        Remove a node, and the links to and from it.
+    """
+    removed = features.pop(index)['properties']
+    links = set(o['link_prmname'] for o in removed['origins'] + removed['terminals'])
+    for f in features:
+        props = f['properties']
+        props['origins']   = [o for o in props['origins'] if o['link_prmname'] not in links]
+        props['terminals'] = [t for t in props['terminals'] if t['link_prmname'] not in links]
+    return removed['prmname']
+
+class ContentHashTest(unittest.TestCase):
+
+    def test_key_order(self):
+        a = OrderedDict([('prmname', 'SR_SHA'), ('type', 'Surface Storage'),
+                         ('extras', ['storage', 'inflow'])])
+        b = OrderedDict(reversed(list(a.items())))
+        self.assertEqual(content_hash(a), content_hash(b))
+
+    def test_nested_key_order(self):
+        a = {'properties': OrderedDict([('x', 1), ('y', {'b': 2, 'a': 3})])}
+        b = {'properties': OrderedDict([('y', {'a': 3, 'b': 2}), ('x', 1)])}
+        self.assertEqual(content_hash(a), content_hash(b))
+
+    def test_stable(self):
+        #The hash is stored in the layout of hydra nodes, so it must not
+        #change between runs or versions.
+        self.assertEqual(content_hash({'prmname': 'SR_SHA', 'capacity': 4552000}),
+                         '5c14947866f0f88499bcaea22465ec10c4825b99')
+
+    def test_changed_value(self):
+        self.assertNotEqual(content_hash({'capacity': 1}), content_hash({'capacity': 2}))
+        self.assertNotEqual(content_hash({'extras': ['a', 'b']}),
+                            content_hash({'extras': ['b', 'a']}))
+
+class HobbesSyncTest(unittest.TestCase):
+
+    def setUp(self):
+        self.features = SyntheticHobbesNetwork(num_nodes=20, series_length=5).features
+        self.importer = import_network(copy.deepcopy(self.features))
+
+    def sync(self, features):
+        self.importer.json_net = features
+        hobbes_sync = HobbesSync(self.importer)
+        hobbes_sync.sync(self.importer.network.id, self.importer.scenario.id)
+        return hobbes_sync
+
+    def test_unchanged(self):
+        self.importer.connection.num_calls.clear()
+        hobbes_sync = self.sync(copy.deepcopy(self.features))
+
+        self.assertEqual((hobbes_sync.added, hobbes_sync.changed, hobbes_sync.removed),
+                         ([], [], []))
+        #Nothing is sent to hydra.
+        calls = set(self.importer.connection.num_calls)
+        self.assertEqual([c for c in calls if not c.startswith('get_')], [])
+
+    def test_diff(self):
+        features = copy.deepcopy(self.features)
+        removed = remove_node(features, 10)
+
+        features[5]['properties']['description'] = 'changed'
+
+        added = copy.deepcopy(features[2])
+        added['properties'].update(prmname='SN_NEW', terminals=[],
+                                   origins=[{'link_prmname':'SN_00001-SN_NEW'}])
+        features[1]['properties']['terminals'].append({'link_prmname':'SN_00001-SN_NEW'})
+        features.append(added)
+
+        hobbes_sync = self.sync(features)
+
+        self.assertEqual(hobbes_sync.added, ['SN_NEW'])
+        self.assertEqual(hobbes_sync.removed, [removed])
+        #The nodes whose links changed, and the changed node
+        self.assertTrue(features[5]['properties']['prmname'] in hobbes_sync.changed)
+        self.assertTrue('SN_00001' in hobbes_sync.changed)
+
+        #The synced network is the network a new import would make.
+        self.assertEqual(describe_network(self.importer),
+                         describe_network(import_network(features)))
+
+    def test_removed_property(self):
+        features = copy.deepcopy(self.features)
+        props = features[3]['properties']
+        param = sorted(k for k in props if '_param_' in k)[0]
+        del props[param]
+
+        hobbes_sync = self.sync(features)
+
+        self.assertEqual(hobbes_sync.changed, [props['prmname']])
+        self.assertEqual(hobbes_sync.data_removed, 1)
+
+class HobbesSubsetSyncTest(unittest.TestCase):
+
+    def setUp(self):
+        self.features = SyntheticHobbesNetwork(num_nodes=20, series_length=5).features
+        self.importer = import_network(copy.deepcopy(self.features),
+                                       subset=NetworkSubset(regions=['Tulare']))
+
+    def sync(self, features):
+        self.importer.json_net = features
+        hobbes_sync = HobbesSync(self.importer)
+        hobbes_sync.sync(self.importer.network.id, self.importer.scenario.id)
+        return hobbes_sync
+
+    def add_node(self, features, prmname, region):
+        added = copy.deepcopy(features[2])
+        added['properties'].update(prmname=prmname, regions=[region],
+                                   origins=[], terminals=[])
+        features.append(added)
+
+    def test_unchanged(self):
+        self.importer.connection.num_calls.clear()
+        hobbes_sync = self.sync(copy.deepcopy(self.features))
+
+        #The nodes outside the subset are not added.
+        self.assertEqual((hobbes_sync.added, hobbes_sync.changed, hobbes_sync.removed),
+                         ([], [], []))
+        calls = set(self.importer.connection.num_calls)
+        self.assertEqual([c for c in calls if not c.startswith('get_')], [])
+
+    def test_diff(self):
+        features = copy.deepcopy(self.features)
+        self.add_node(features, 'SN_OUTSIDE', 'Sacramento')
+        self.add_node(features, 'SN_INSIDE', 'Tulare')
+
+        hobbes_sync = self.sync(features)
+
+        self.assertEqual(hobbes_sync.added, ['SN_INSIDE'])
+        self.assertEqual(hobbes_sync.removed, [])
+
+        nodes, links = describe_network(self.importer)
+        self.assertEqual(set(n[0] for n in nodes),
+                         set(f['properties']['prmname'] for f in features
+                             if f['properties']['regions'] == ['Tulare']))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# test_hobbes_timeseries is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# test_hobbes_timeseries is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with test_hobbes_timeseries.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+Tests of the conversion of hobbes timeseries to hydra timeseries.
+"""
+
+import os, sys
+
+import json
+
+import random
+
+import unittest
+
+import calendar
+
+from datetime import datetime, date, timedelta
+
+__location__ = os.path.split(os.path.abspath(__file__))[0]
+
+sys.path.insert(0, os.path.join(__location__, '..', 'plugins', 'hobbes_import'))
+
+from HydraLib.HydraException import HydraPluginError
+
+from hobbes_timeseries import parse_timeseries, convert_extras
+
+#The format hydra is configured with, and some others
+TIME_FORMATS = ['%Y-%m-%dT%H:%M:%S.%f000Z', '%Y-%m-%d', '%d/%m/%Y %H:%M', '%b %d %Y']
+
+def old_parse_timeseries(timeseries_value, timeformat):
+    """
+        The conversion as it was done before it used numpy, one datetime
+        at a time.
+    """
+    val = {}
+    for timeval in timeseries_value[1:]:
+        split = timeval[0].split('-')
+        d = datetime(year=int(split[0]), month=int(split[1]), day=int(split[2]))
+        val[datetime.strftime(d, timeformat)] = float(timeval[1])
+    return {"idx1": val}
+
+def make_series(num_values, start=date(1921, 10, 1), step=1):
+    rand = random.Random(num_values)
+    series = [['date', 'storage']]
+    for i in range(num_values):
+        d = start + timedelta(days=i * step)
+        series.append([str(d), round(rand.uniform(0, 1000), 3)])
+    return series
+
+def make_monthly_series(dates):
+    """
+        A series on the given (year, month, day) dates. A day of None is the
+        last day of the month.
+    """
+    series = [['date', 'storage']]
+    for i, (year, month, day) in enumerate(dates):
+        if day is None:
+            day = calendar.monthrange(year, month)[1]
+        series.append(['%04d-%02d-%02d'%(year, month, day), float(i)])
+    return series
+
+def months(num_values, step=1, day=1, start=(1921, 10)):
+    """
+        (year, month, day) every 'step' months from the start.
+    """
+    year, month = start
+    for i in range(num_values):
+        yield (year + (month - 1 + i*step) // 12, (month - 1 + i*step) % 12 + 1, day)
+
+class ParseTimeseriesTest(unittest.TestCase):
+
+    def test_same_as_before(self):
+        series = make_series(400)
+        #Dates which are not zero-padded, and integer values
+        series.append(['1923-1-5', 12])
+        for timeformat in TIME_FORMATS:
+            self.assertEqual(parse_timeseries(series, timeformat),
+                             old_parse_timeseries(series, timeformat))
+
+    def test_json_same_as_before(self):
+        #Hydra receives the series as JSON, so that must not change either.
+        series = make_series(50)
+        timeformat = TIME_FORMATS[0]
+        converted = dict(convert_extras({'prmname':'SR_SHA', 'storage':series}, timeformat))
+        self.assertEqual(json.loads(converted['storage']),
+                         json.loads(json.dumps(old_parse_timeseries(series, timeformat))))
+
+    def test_empty(self):
+        self.assertEqual(parse_timeseries([['date', 'storage']], TIME_FORMATS[0]),
+                         {'idx1': {}})
+
+    def test_invalid_value(self):
+        for value in (None, 'n/a', float('nan')):
+            series = make_series(5)
+            series[3][1] = value
+            self.assertRaises(HydraPluginError, parse_timeseries, series, TIME_FORMATS[0])
+
+    def test_invalid_date(self):
+        for bad_date in ('1950-13-01', '1950-2-30', 'yesterday'):
+            series = make_series(5)
+            series[2][0] = bad_date
+            self.assertRaises(HydraPluginError, parse_timeseries, series, TIME_FORMATS[0])
+
+    def test_repeated_date(self):
+        series = make_series(5)
+        series.append(list(series[1]))
+        self.assertRaises(HydraPluginError, parse_timeseries, series, TIME_FORMATS[0])
+
+class CompactTimeseriesTest(unittest.TestCase):
+
+    def encode(self, series):
+        return parse_timeseries(series, '%Y-%m-%d', 'compact')
+
+    def test_daily(self):
+        encoded = self.encode(make_series(10, step=7))
+        self.assertEqual((encoded['start'], encoded['frequency']), ('1921-10-01', '7D'))
+        self.assertEqual(len(encoded['values']), 10)
+
+    def test_monthly(self):
+        encoded = self.encode(make_monthly_series(months(30)))
+        self.assertEqual((encoded['start'], encoded['frequency']), ('1921-10-01', '1M'))
+        self.assertEqual(encoded['values'], [float(i) for i in range(30)])
+
+        encoded = self.encode(make_monthly_series(months(8, step=3, day=15)))
+        self.assertEqual((encoded['start'], encoded['frequency']), ('1921-10-15', '3M'))
+
+    def test_month_end(self):
+        encoded = self.encode(make_monthly_series(months(30, day=None)))
+        self.assertEqual((encoded['start'], encoded['frequency']), ('1921-10-31', '1ME'))
+        self.assertEqual(encoded['values'], [float(i) for i in range(30)])
+
+    def test_irregular(self):
+        #A month is skipped, and one date is not at the end of its month.
+        for dates in ([(1921, 10, 1), (1921, 11, 1), (1922, 1, 1)],
+                      [(1921, 10, None), (1921, 11, 29), (1921, 12, None)]):
+            encoded = self.encode(make_monthly_series(dates))
+            self.assertTrue('frequency' not in encoded)
+            self.assertEqual(len(encoded['index']), 3)
+
+if __name__ == '__main__':
+    unittest.main()
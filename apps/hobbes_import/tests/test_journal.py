@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# test_journal is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# test_journal is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with test_journal.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+Tests of the checkpoint journal of an import.
+"""
+
+import os, sys
+
+import shutil
+
+import tempfile
+
+import unittest
+
+__location__ = os.path.split(os.path.abspath(__file__))[0]
+
+sys.path.insert(0, os.path.join(__location__, '..', 'plugins', 'hobbes_import'))
+
+from HydraLib.HydraException import HydraPluginError
+
+from hobbes_journal import ImportJournal
+
+class ImportJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'import.journal')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_journal(self):
+        journal = ImportJournal(self.path)
+        journal.start(1, 2, 3)
+        journal.record_extras('SR_SHA')
+        journal.record_extras('SR_ORO')
+        journal.record_batch([{'resource_attr_id':10}, {'resource_attr_id':11}])
+        journal.close()
+        return journal
+
+    def test_resume(self):
+        self.write_journal()
+
+        journal = ImportJournal(self.path)
+        journal.load()
+        self.assertEqual((journal.network_id, journal.scenario_id, journal.template_id),
+                         (1, 2, 3))
+        self.assertEqual(journal.fetched, set(['SR_SHA', 'SR_ORO']))
+        self.assertEqual(journal.uploaded, set([10, 11]))
+
+        #A resumed journal is appended to.
+        journal.record_batch([{'resource_attr_id':12}])
+        journal.close()
+
+        journal = ImportJournal(self.path)
+        journal.load()
+        self.assertEqual(journal.uploaded, set([10, 11, 12]))
+        journal.close()
+
+    def test_truncated_last_line(self):
+        self.write_journal()
+        with open(self.path, 'a') as f:
+            f.write('{"event": "batch", "resource_attr_ids": [12, 1')
+
+        journal = ImportJournal(self.path)
+        journal.load()
+        self.assertEqual(journal.fetched, set(['SR_SHA', 'SR_ORO']))
+        self.assertEqual(journal.uploaded, set([10, 11]))
+        journal.close()
+
+    def test_complete(self):
+        self.write_journal()
+        journal = ImportJournal(self.path)
+        journal.load()
+        journal.finish()
+
+        self.assertRaises(HydraPluginError, ImportJournal(self.path).load)
+
+    def test_missing_or_empty(self):
+        self.assertRaises(HydraPluginError, ImportJournal(self.path).load)
+
+        open(self.path, 'w').close()
+        self.assertRaises(HydraPluginError, ImportJournal(self.path).load)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# test_request_scheduler is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# test_request_scheduler is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with test_request_scheduler.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+Tests of the adaptive concurrency limit of requests to a host.
+"""
+
+import os, sys
+
+import random
+
+import unittest
+
+__location__ = os.path.split(os.path.abspath(__file__))[0]
+
+sys.path.insert(0, os.path.join(__location__, '..', 'plugins', 'hobbes_import'))
+
+from request_scheduler import HostLimiter
+
+class HostLimiterTest(unittest.TestCase):
+
+    def request(self, limiter, latency=None, failed=False):
+        limiter.acquire()
+        limiter.release(latency=latency, failed=failed)
+
+    def warm_up(self, limiter, latency=0.1, num_requests=100):
+        for i in range(num_requests):
+            self.request(limiter, latency)
+
+    def test_normal_latency(self):
+        rand = random.Random(1)
+        limiter = HostLimiter(max_connections=8)
+        limits = []
+        for i in range(2000):
+            #Latencies vary around 100ms, with an occasional slow response.
+            latency = rand.expovariate(10.0)
+            if i % 50 == 0:
+                latency = 2.0
+            self.request(limiter, latency)
+            limits.append(limiter.limit)
+
+        self.assertTrue(min(limits) >= 7.0, min(limits))
+        self.assertTrue(sum(limits) / len(limits) > 7.5)
+
+    def test_single_slow_response(self):
+        limiter = HostLimiter(max_connections=8)
+        self.warm_up(limiter)
+        self.request(limiter, 5.0)
+        self.assertEqual(limiter.limit, 8.0)
+
+    def test_sustained_rise(self):
+        limiter = HostLimiter(max_connections=8, slow_count=3)
+        self.warm_up(limiter)
+        for i in range(3):
+            self.request(limiter, 1.0)
+        self.assertEqual(limiter.limit, 4.0)
+
+    def test_failure(self):
+        limiter = HostLimiter(max_connections=8)
+        self.request(limiter, failed=True)
+        self.assertEqual(limiter.limit, 4.0)
+        self.request(limiter, failed=True)
+        self.assertEqual(limiter.limit, 2.0)
+
+        #The limit grows back while responses are prompt.
+        self.warm_up(limiter)
+        self.assertEqual(limiter.limit, 8.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+#\
+# test_scenario_upload is free software: you can redistribute it and/or modify\
+# it under the terms of the GNU General Public License as published by\
+# the Free Software Foundation, either version 3 of the License, or\
+# (at your option) any later version.\
+#\
+# test_scenario_upload is distributed in the hope that it will be useful,\
+# but WITHOUT ANY WARRANTY; without even the implied warranty of\
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the\
+# GNU General Public License for more details.\
+# \
+# You should have received a copy of the GNU General Public License\
+# along with test_scenario_upload.  If not, see <http://www.gnu.org/licenses/>\
+#
+
+"""
+Tests of the batched upload of resource scenarios.
+"""
+
+import os, sys
+
+import unittest
+
+__location__ = os.path.split(os.path.abspath(__file__))[0]
+
+sys.path.insert(0, os.path.join(__location__, '..', 'plugins', 'hobbes_import'))
+
+from HydraLib.HydraException import HydraPluginError
+
+from scenario_upload import ScenarioUploader
+
+class RecordingConnection(object):
+    """
+        Records the batches sent to update_resourcedata, failing on the
+        call numbered 'fail_on', if given.
+    """
+    def __init__(self, fail_on=None):
+        self.batches = []
+        self.fail_on = fail_on
+
+    def call(self, func, args):
+        assert func == 'update_resourcedata'
+        if self.fail_on is not None and len(self.batches) == self.fail_on:
+            raise Exception("Upload failed")
+        self.batches.append((args['scenario_id'], list(args['resource_scenarios'])))
+
+class ScenarioUploaderTest(unittest.TestCase):
+
+    def test_batches(self):
+        connection = RecordingConnection()
+        uploaded = []
+        uploader = ScenarioUploader(connection, 5, batch_size=3,
+                                    on_upload=uploaded.extend)
+        for i in range(7):
+            uploader.add(i)
+        uploader.close()
+
+        self.assertEqual(connection.batches, [(5, [0, 1, 2]), (5, [3, 4, 5]), (5, [6])])
+        self.assertEqual(uploader.num_uploaded, 7)
+        self.assertEqual(uploader.num_batches, 3)
+        self.assertEqual(uploaded, range(7))
+
+    def test_workers(self):
+        #Batches may arrive in any order, but each is sent exactly once.
+        connection = RecordingConnection()
+        uploader = ScenarioUploader(connection, 5, batch_size=10, workers=4)
+        for i in range(95):
+            uploader.add(i)
+        uploader.close()
+
+        self.assertEqual(len(connection.batches), 10)
+        self.assertEqual(sorted(i for scenario_id, batch in connection.batches
+                                for i in batch), range(95))
+        self.assertEqual(uploader.num_uploaded, 95)
+
+    def test_empty(self):
+        connection = RecordingConnection()
+        uploader = ScenarioUploader(connection, 5)
+        uploader.close()
+        self.assertEqual(connection.batches, [])
+
+    def test_error(self):
+        connection = RecordingConnection(fail_on=1)
+        uploader = ScenarioUploader(connection, 5, batch_size=2)
+        for i in range(4):
+            uploader.add(i)
+        self.assertRaises(HydraPluginError, uploader.close)
+        self.assertEqual(connection.batches, [(5, [0, 1])])
+        self.assertEqual(uploader.num_uploaded, 2)
+
+    def test_abort(self):
+        connection = RecordingConnection()
+        uploader = ScenarioUploader(connection, 5, batch_size=10)
+        uploader.add(0)
+        uploader.abort()
+        self.assertEqual(connection.batches, [])
+        self.assertRaises(HydraPluginError, uploader.add, 1)
+
+if __name__ == '__main__':
+    unittest.main()